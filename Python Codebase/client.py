@@ -6,15 +6,60 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, scrolledtext
 import socket
 import threading
-import json
-import select
-import base64
+import collections
+import functools
+import itertools
+import shutil
+import tempfile
+import time
+from datetime import datetime
 import os
 import sys
 import config
-from protocol import Message
+from protocol import (Message, FrameReader, configure_socket, send_frame, send_sealed_frame, send_file_frame,
+                      split_frame, frame_body, iter_file_bodies, MSG_DONTWAIT)
 from encryption import MessageEncryption
-from io_multiplexer import IOMultiplexer
+from io_multiplexer import IOMultiplexer, resolve_method
+
+# Virtual event the receive thread uses to wake the Tk main loop
+UI_WAKE_EVENT = '<<IncomingMessages>>'
+
+# Local UI-queue entry type: a callable to run on the Tk main thread
+UI_CALLBACK = 'UI_CALLBACK'
+
+
+def throttle(ms):
+    """
+    Coalesce calls to a client method to at most one run per `ms` milliseconds
+
+    The first call runs immediately; calls inside the window are collapsed
+    into one deferred run (with the latest arguments) scheduled via
+    root.after. State is stored on the instance, not the function, so each
+    client throttles independently. Main (Tk) thread only.
+    """
+    def decorator(func):
+        state_attr = '_throttle_' + func.__name__
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            # [last run time, pending after() id, latest (args, kwargs)]
+            state = self.__dict__.setdefault(state_attr, [0.0, None, None])
+            wait = state[0] + ms / 1000 - time.monotonic()
+            if wait <= 0 and state[1] is None:
+                state[0] = time.monotonic()
+                return func(self, *args, **kwargs)
+
+            state[2] = (args, kwargs)
+            if state[1] is None:
+                def run_pending():
+                    state[1] = None
+                    state[0] = time.monotonic()
+                    pending_args, pending_kwargs = state[2]
+                    func(self, *pending_args, **pending_kwargs)
+                state[1] = self.root.after(max(int(wait * 1000), 1), run_pending)
+
+        return wrapper
+    return decorator
 
 
 class ClassChatClient:
@@ -31,23 +76,49 @@ class ClassChatClient:
         self.username = None
         self.encryption = MessageEncryption()
         self.receive_thread = None
+        self.reader = None  # FrameReader for the current connection
 
-        # I/O MULTIPLEXING - Auto-detect best method
-        # Priority: epoll (Linux) > poll (Unix) > select (All platforms)
-        if hasattr(select, 'epoll'):
-            self.io_method = 'epoll'
-        elif hasattr(select, 'poll'):
-            self.io_method = 'poll'
-        else:
-            self.io_method = 'select'
+        # I/O MULTIPLEXING - config.IO_METHOD ('auto' picks epoll > poll > select)
+        self.io_method = resolve_method(config.IO_METHOD)
 
         self.io_multiplexer = None  # Will be created after socket connection
+        self._shutdown_r = None  # socketpair written by disconnect() to wake the receive thread
+        self._shutdown_w = None
         print(f"[CLIENT] Using I/O multiplexing method: {self.io_method}")
 
         # CONVERSATION THREADING
         self.current_recipient = None
         self.current_chat_type = None  # 'private' or 'group'
         self.file_to_send = None
+        self._file_sender = None  # Thread streaming the current outgoing file
+
+        # SEND LOCK - frames from the UI thread and the file sender thread must not interleave
+        self._send_lock = threading.Lock()
+
+        # UI QUEUE - Tk widgets are only touched from the main thread
+        self._ui_queue = collections.deque()  # Received messages (filled by receive thread)
+        self._display_buffer = []  # Pending (text, tag) inserts for the chat display
+        self._batching = False
+        # A threaded Tcl marshals calls from the receive thread to the main loop, so
+        # it can wake the UI per burst; otherwise the main loop polls the queue
+        self._ui_polling = not self._tcl_is_threaded()
+
+        # INCOMING FILES - sender -> [header message, spool file, chunks remaining]
+        self._incoming_files = {}
+
+        # LISTBOX BACKING DATA - names in the same order as the listbox rows,
+        # plus name -> displayed line so updates only touch changed rows
+        self._users_by_index = []
+        self._groups_by_index = []
+        self._users_view = {}
+        self._groups_view = {}
+        # Local caches kept current by server-pushed deltas (no re-listing)
+        self._online_users = {}  # username -> status
+        self._users_generation = 0  # Server user-list generation of the last delta applied
+        self._groups = {}  # group name -> creator
+
+        # MESSAGE DISPATCH - msg_type -> handler
+        self._dispatch = self._create_dispatch_table()
 
         self.create_login_screen()
 
@@ -106,82 +177,77 @@ class ClassChatClient:
                 port = config.SERVER_PORT
 
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            configure_socket(self.socket)
+            # Connect and handshake wait for the server's replies as they arrive,
+            # but no longer than the server itself allows for a handshake
+            self.socket.settimeout(config.HANDSHAKE_TIMEOUT)
             self.socket.connect((host, port))
             self.username = username
 
+            # One buffered reader for the whole connection: the server sends the
+            # connect response and its public key back-to-back, so a single recv
+            # usually returns both and nothing read ahead is lost
+            self.reader = FrameReader(self.socket)
+
             connect_msg = Message.create_connect_message(username)
-            self.socket.send(connect_msg.encode())
+            send_frame(self.socket, connect_msg)
 
-            response_data = self.socket.recv(config.BUFFER_SIZE)
-            response = Message.parse_message(response_data.decode('utf-8'))
+            response = Message.parse_message(self.reader.read_frame())
 
             if response and response.get('type') == config.MSG_SUCCESS:
                 self.connected = True
+                self._users_generation = 0  # Generations restart with each server
                 
                 # ENCRYPTION KEY EXCHANGE
                 if config.USE_ENCRYPTION:
                     print("[CLIENT] Starting encryption key exchange...")
                     
-                    # Receive server's RSA public key
-                    key_data = self.socket.recv(config.BUFFER_SIZE)
-                    key_message = Message.parse_message(key_data.decode('utf-8'))
+                    # The server's X25519 public key arrives with the welcome message
+                    server_public_key = (response.get('data') or {}).get('public_key')
                     
-                    if key_message and key_message.get('type') == config.MSG_KEY_EXCHANGE:
-                        public_key_pem = key_message.get('data', {}).get('public_key')
+                    if server_public_key:
+                        print("[CLIENT] Received X25519 public key from server")
                         
-                        if public_key_pem:
-                            # Load server's public key
-                            self.encryption.load_public_key_pem(public_key_pem)
-                            print("[CLIENT] Received RSA public key from server")
-                            
-                            # Generate AES session key
-                            self.encryption.generate_session_key()
-                            print("[CLIENT] Generated AES session key")
-                            
-                            # Encrypt session key with server's RSA public key
-                            encrypted_session_key = self.encryption.encrypt_session_key()
-                            print("[CLIENT] Encrypted session key")
-                            
-                            # Send encrypted session key to server
-                            key_response = Message.create_message(
-                                config.MSG_KEY_EXCHANGE,
-                                username,
-                                "SERVER",
-                                None,
-                                {"encrypted_session_key": encrypted_session_key, "step": "client_session_key"}
-                            )
-                            self.socket.send(key_response.encode())
-                            print("[CLIENT] Sent encrypted session key to server")
-                            
-                            # Wait for acknowledgment
-                            ack_data = self.socket.recv(config.BUFFER_SIZE)
-                            ack_message = Message.parse_message(ack_data.decode('utf-8'))
-                            
-                            if ack_message and ack_message.get('type') == config.MSG_KEY_EXCHANGE:
-                                print("[CLIENT] ✅ Encryption established successfully")
-                            else:
-                                print("[CLIENT ERROR] Key exchange acknowledgment failed")
-                                self.socket.close()
-                                self.socket = None
-                                return
-                        else:
-                            print("[CLIENT ERROR] No public key received")
-                            self.socket.close()
-                            self.socket = None
-                            return
+                        # Generate ephemeral key pair and derive AES session key (ECDH + HKDF)
+                        self.encryption.generate_x25519_keys()
+                        self.encryption.derive_session_key(server_public_key)
+                        print("[CLIENT] Derived AES session key")
+                        
+                        # Send our public key; the server derives the same session key
+                        key_response = Message.create_message(
+                            config.MSG_KEY_EXCHANGE,
+                            username,
+                            "SERVER",
+                            None,
+                            {"public_key": self.encryption.get_x25519_public_key(), "step": "client_public_key"}
+                        )
+                        send_frame(self.socket, key_response)
+                        print("[CLIENT] ✅ Encryption established successfully")
                     else:
-                        print("[CLIENT ERROR] Invalid key exchange message")
+                        print("[CLIENT ERROR] No public key received")
+                        self.connected = False
                         self.socket.close()
                         self.socket = None
                         return
 
-                # Create I/O multiplexer for this socket
-                self.io_multiplexer = IOMultiplexer(method=self.io_method)
+                # Back to plain blocking mode: the receive thread waits in the multiplexer
+                self.socket.settimeout(None)
+
+                # Use the process-wide I/O multiplexer and register this socket once, plus
+                # the shutdown socketpair so the receive thread can block without a timeout
+                self.io_multiplexer = IOMultiplexer.get(self.io_method)
+                self._shutdown_r, self._shutdown_w = socket.socketpair()
+                self.io_multiplexer.register(self.socket)
+                self.io_multiplexer.register(self._shutdown_r)
                 print(f"[CLIENT] I/O multiplexer initialized with {self.io_method}()")
 
                 self.receive_thread = threading.Thread(target=self.receive_messages, daemon=True)
                 self.receive_thread.start()
                 self.create_chat_screen()
+                if not self._ui_polling:
+                    self.root.bind(UI_WAKE_EVENT, lambda event: self._drain_ui())
+                # First drain picks up anything queued before the screen existed
+                self.root.after_idle(self._drain_ui)
             else:
                 self.status_label.config(text=response.get('text', 'Connection failed'))
                 self.socket.close()
@@ -287,6 +353,7 @@ class ClassChatClient:
         self.chat_display = scrolledtext.ScrolledText(chat_container, wrap=tk.WORD,
                                                       state=tk.DISABLED, font=('Arial', 11))
         self.chat_display.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self._configure_chat_tags()
 
         input_frame = tk.Frame(chat_container, bg='white')
         input_frame.pack(fill=tk.X, padx=10, pady=10)
@@ -312,105 +379,264 @@ class ClassChatClient:
         self.current_recipient = None
         self.current_chat_type = None
 
+    def _configure_chat_tags(self):
+        """Configure chat display text styles once (tags persist on the widget)"""
+        self.chat_display.tag_config('timestamp', foreground='gray', font=('Arial', 9))
+        self.chat_display.tag_config('encrypt_label', foreground='#27ae60', font=('Arial', 10, 'bold italic'))
+        self.chat_display.tag_config('sent', foreground='#2980b9', font=('Arial', 11))
+        self.chat_display.tag_config('received', foreground='#27ae60', font=('Arial', 11))
+        self.chat_display.tag_config('group', foreground='#8e44ad', font=('Arial', 11))
+        self.chat_display.tag_config('system', foreground='#95a5a6', font=('Arial', 10, 'italic'))
+        self.chat_display.tag_config('error', foreground='#e74c3c', font=('Arial', 10, 'bold'))
+        self.chat_display.tag_config('encrypted_header', foreground='#27ae60', font=('Arial', 16, 'bold'))
+        self.chat_display.tag_config('header', foreground='#7f8c8d')
+
     def receive_messages(self):
         """Receive messages thread using I/O multiplexing"""
+        reader = self.reader
+        socket_fd = self.socket.fileno()
+        shutdown_fd = self._shutdown_r.fileno()
+
+        # Frames that arrived together with the handshake are already buffered
+        for frame in reader.frames():
+            self.handle_frame(frame)
+        self._wake_ui()
+
         while self.connected:
             try:
-                # Use I/O multiplexer (select/poll/epoll)
-                if self.io_multiplexer.wait_for_read(self.socket, timeout=1):
-                    data = self.socket.recv(config.BUFFER_SIZE)
-                    if not data:
+                # Mid-frame (e.g. a file chunk) the rest is usually already in the
+                # socket buffer: read it directly and skip the readiness wait, so
+                # one syscall both waits and reads
+                if MSG_DONTWAIT and reader.has_partial_frame():
+                    try:
+                        if not reader.fill(MSG_DONTWAIT):
+                            break
+                    except BlockingIOError:
+                        pass
+                    else:
+                        for frame in reader.frames():
+                            self.handle_frame(frame)
+                        self._wake_ui()
+                        continue
+
+                # Use I/O multiplexer (select/poll/epoll); sleeps until data arrives
+                # or disconnect() writes to the shutdown socket - no idle wakeups
+                ready = self.io_multiplexer.poll(timeout=None)
+                if shutdown_fd in ready:
+                    break
+                if socket_fd in ready:
+                    # One recv for the whole burst, then handle every complete frame
+                    if not reader.fill():
                         break
-                    message_str = data.decode('utf-8')
-                    
-                    # DECRYPT MESSAGE if encryption is enabled and ready
-                    if config.USE_ENCRYPTION and self.encryption.is_ready():
-                        try:
-                            message_str = self.encryption.decrypt_message(message_str)
-                        except Exception as e:
-                            print(f"[CLIENT ERROR] Decryption error: {e}")
-                            continue
-                    
-                    message = Message.parse_message(message_str)
-                    if message:
-                        self.process_received_message(message)
+                    for frame in reader.frames():
+                        self.handle_frame(frame)
+                    self._wake_ui()
             except Exception as e:
                 if self.connected:
                     print(f"[CLIENT ERROR] Receive error: {e}")
                 break
         self.disconnect()
+        self.close_shutdown_pair()
+
+    def close_shutdown_pair(self):
+        """Close the shutdown socketpair once the receive thread has stopped"""
+        shutdown_r, shutdown_w = self._shutdown_r, self._shutdown_w
+        self._shutdown_r = self._shutdown_w = None
+        if shutdown_r:
+            self.io_multiplexer.unregister(shutdown_r)
+            shutdown_r.close()
+            shutdown_w.close()
+
+    def handle_frame(self, frame):
+        """Decrypt and parse one received frame, then queue it for the UI thread"""
+        # DECRYPT FRAME if encryption is enabled and ready
+        # (the whole body - header and payload - is one AES-GCM message)
+        if config.USE_ENCRYPTION and self.encryption.is_ready():
+            try:
+                frame = self.encryption.decrypt_bytes(frame)
+            except Exception as e:
+                print(f"[CLIENT ERROR] Decryption error: {e}")
+                return
+
+        data, payload = split_frame(frame)
+
+        # parse_message accepts the raw bytes directly (no decode needed)
+        message = Message.parse_message(data)
+        if message:
+            if payload is not None:
+                message['payload'] = payload
+            self._ui_queue.append(message)
+
+    def _tcl_is_threaded(self):
+        """Check whether Tcl was built with thread support"""
+        try:
+            return bool(int(self.root.tk.eval('set tcl_platform(threaded)')))
+        except (tk.TclError, ValueError, TypeError):
+            return False
+
+    def _wake_ui(self):
+        """
+        Ask the Tk main loop to drain the UI queue (called once per received burst).
+        The event is queued to the main thread; no widget is touched here.
+        """
+        if self._ui_queue and not self._ui_polling:
+            self.root.event_generate(UI_WAKE_EVENT, when='tail')
+
+    def _drain_ui(self):
+        """
+        Apply all queued messages on the Tk main thread.
+        Chat display updates are batched into a single insert pass.
+        """
+        self._batching = True
+        try:
+            while self._ui_queue:
+                self.process_received_message(self._ui_queue.popleft())
+        finally:
+            self._batching = False
+            self._flush_display()
+
+        if self._ui_polling and self.connected:
+            self.root.after(config.UI_DRAIN_INTERVAL_MS, self._drain_ui)
+
+    def _flush_display(self):
+        """Insert all pending chat lines with one enable/disable and one scroll"""
+        if not self._display_buffer:
+            return
+        chat_display = self.chat_display
+        chat_display.config(state=tk.NORMAL)
+        # Text.insert takes (chars, tags) pairs, so the whole batch is one Tcl call
+        chat_display.insert(tk.END, *itertools.chain.from_iterable(self._display_buffer))
+        self._display_buffer.clear()
+        chat_display.config(state=tk.DISABLED)
+        chat_display.see(tk.END)
+
+    def _create_dispatch_table(self):
+        """Map message types to their handlers (built once, O(1) lookup per message)"""
+        return {
+            config.MSG_PRIVATE: self._on_private,
+            config.MSG_GROUP: self._on_group,
+            config.MSG_FILE: self._on_file,
+            config.MSG_FILE_CHUNK: self.handle_file_chunk,
+            config.MSG_SUCCESS: self._on_success,
+            config.MSG_ERROR: self._on_error,
+            config.MSG_OFFLINE: self._on_offline,
+            config.MSG_LIST_USERS: self._on_list_users,
+            config.MSG_LIST_GROUPS: self._on_list_groups,
+            config.MSG_USER_DELTA: self._on_user_delta,
+            config.MSG_GROUP_DELTA: self._on_group_delta,
+            config.MSG_HISTORY_RESPONSE: self.handle_history_response,
+            UI_CALLBACK: self._on_ui_callback
+        }
 
     def process_received_message(self, message):
         """Process received message with CONVERSATION FILTERING"""
-        msg_type = message.get('type')
+        handler = self._dispatch.get(message.get('type'))
+        if handler:
+            handler(message)
+
+    def _open_private_chat_from(self, sender):
+        """No chat open - set context so an incoming private message/file is shown"""
+        self.current_recipient = sender
+        self.current_chat_type = 'private'
+        self.chat_header.config(text=f"Private Chat with {sender}")
+        self.display_message("", 'encrypted_header')
+
+    def _on_private(self, message):
+        """Private message - ONLY display if this matches current private chat"""
+        sender = message['sender']
+        text = message['text']
+        if self.current_chat_type == 'private' and self.current_recipient == sender:
+            self.display_message(f"{sender} (private): {text}", 'received')
+        elif not self.current_recipient:
+            # No chat open - set context for offline message
+            self._open_private_chat_from(sender)
+            self.display_message(f"{sender} (private): {text}", 'received')
+        else:
+            # Message from different conversation - ignore
+            print(f"[CLIENT] Ignoring message from {sender} (current chat: {self.current_recipient})")
+
+    def _on_group(self, message):
+        """Group message - ONLY display if this matches current group chat"""
+        group = message['receiver']
+        if self.current_chat_type == 'group' and self.current_recipient == group:
+            self.display_message(f"{message['sender']} @{group}: {message['text']}", 'group')
+        else:
+            # Message from different group - ignore
+            print(f"[CLIENT] Ignoring group message from {group} (current chat: {self.current_recipient})")
+
+    def _on_file(self, message):
+        """File header - same conversation filtering as private/group messages"""
         sender = message.get('sender')
-        text = message.get('text')
-        receiver = message.get('receiver')
 
-        # CRITICAL: Filter messages by current chat
-        if msg_type == config.MSG_PRIVATE:
-            # ONLY display if this matches current private chat
+        if message.get('is_group', False):
+            # This is a GROUP file transfer
+            group_name = message.get('receiver')
+            # Only process if we're currently viewing THIS group chat
+            if self.current_chat_type == 'group' and self.current_recipient == group_name:
+                self.begin_received_file(message)
+            else:
+                print(f"[CLIENT] Ignoring group file from {group_name} (current chat: {self.current_recipient})")
+        else:
+            # This is a PRIVATE file transfer
+            # Only process if we're currently viewing a private chat with THIS sender
             if self.current_chat_type == 'private' and self.current_recipient == sender:
-                self.display_message(f"{sender} (private): {text}", 'received')
+                self.begin_received_file(message)
             elif not self.current_recipient:
-                # No chat open - set context for offline message
-                self.current_recipient = sender
-                self.current_chat_type = 'private'
-                self.chat_header.config(text=f"Private Chat with {sender}")
-                self.display_message("", 'encrypted_header')
-                self.display_message(f"{sender} (private): {text}", 'received')
-            else:
-                # Message from different conversation - ignore
-                print(f"[CLIENT] Ignoring message from {sender} (current chat: {self.current_recipient})")
-
-        elif msg_type == config.MSG_GROUP:
-            group = message.get('receiver')
-            # ONLY display if this matches current group chat
-            if self.current_chat_type == 'group' and self.current_recipient == group:
-                self.display_message(f"{sender} @{group}: {text}", 'group')
+                # No chat open - open private chat with sender
+                self._open_private_chat_from(sender)
+                self.begin_received_file(message)
             else:
-                # Message from different group - ignore
-                print(f"[CLIENT] Ignoring group message from {group} (current chat: {self.current_recipient})")
+                print(f"[CLIENT] Ignoring private file from {sender} (current chat: {self.current_recipient})")
 
-        elif msg_type == config.MSG_FILE:
-            # ✅ FIXED: Add proper filtering (same logic as private/group messages)
-            sender = message.get('sender')
-            is_group = message.get('is_group', False)
+    def _call_in_ui(self, func, *args):
+        """Run func(*args) on the Tk main thread (safe to call from any thread)"""
+        self._ui_queue.append({'type': UI_CALLBACK, 'callback': functools.partial(func, *args)})
+        self._wake_ui()
 
-            if is_group:
-                # This is a GROUP file transfer
-                group_name = message.get('receiver')
-                # Only process if we're currently viewing THIS group chat
-                if self.current_chat_type == 'group' and self.current_recipient == group_name:
-                    self.handle_received_file(message)
-                else:
-                    print(f"[CLIENT] Ignoring group file from {group_name} (current chat: {self.current_recipient})")
-            else:
-                # This is a PRIVATE file transfer
-                # Only process if we're currently viewing a private chat with THIS sender
-                if self.current_chat_type == 'private' and self.current_recipient == sender:
-                    self.handle_received_file(message)
-                elif not self.current_recipient:
-                    # No chat open - open private chat with sender
-                    self.current_recipient = sender
-                    self.current_chat_type = 'private'
-                    self.chat_header.config(text=f"Private Chat with {sender}")
-                    self.display_message("", 'encrypted_header')
-                    self.handle_received_file(message)
-                else:
-                    print(f"[CLIENT] Ignoring private file from {sender} (current chat: {self.current_recipient})")
-        elif msg_type == config.MSG_SUCCESS:
-            self.display_message(f"[✓] {text}", 'system')
-        elif msg_type == config.MSG_ERROR:
-            self.display_message(f"[✗] {text}", 'error')
-        elif msg_type == config.MSG_OFFLINE:
-            self.display_message(f"[📩] {text}", 'system')
-        elif msg_type == config.MSG_LIST_USERS:
-            self.update_users_list(message.get('data', {}).get('users', []))
-        elif msg_type == config.MSG_LIST_GROUPS:
-            self.update_groups_list(message.get('data', {}).get('groups', []))
-        elif msg_type == config.MSG_HISTORY_RESPONSE:
-            self.handle_history_response(message)
+    def _on_ui_callback(self, message):
+        """Callback queued by a worker thread"""
+        message['callback']()
+
+    def _on_success(self, message):
+        """Server success notice"""
+        self.display_message(f"[✓] {message.get('text')}", 'system')
+
+    def _on_error(self, message):
+        """Server error notice"""
+        self.display_message(f"[✗] {message.get('text')}", 'error')
+
+    def _on_offline(self, message):
+        """Offline notice from server"""
+        self.display_message(f"[📩] {message.get('text')}", 'system')
+
+    def _on_list_users(self, message):
+        """Online/offline users list"""
+        data = message.get('data', {})
+        # A snapshot taken before a change we already applied as a delta is stale
+        if data.get('generation', self._users_generation) < self._users_generation:
+            return
+        self.update_users_list(data.get('users', []))
+
+    def _on_list_groups(self, message):
+        """Available groups list"""
+        self.update_groups_list(message.get('data', {}).get('groups', []))
+
+    def _on_user_delta(self, message):
+        """Server push: one user came online or went offline"""
+        data = message.get('data', {})
+        username = data.get('username')
+        self._users_generation = max(self._users_generation, data.get('generation', 0))
+        if data.get('status') == 'online':
+            self._online_users[username] = 'online'
+        else:
+            self._online_users.pop(username, None)
+        self._render_users()
+
+    def _on_group_delta(self, message):
+        """Server push: a group was created"""
+        data = message.get('data', {})
+        self._groups[data.get('name')] = data.get('creator')
+        self._render_groups()
 
     def handle_history_response(self, message):
         """Display conversation history"""
@@ -421,90 +647,84 @@ class ClassChatClient:
 
         print(f"[CLIENT] Received {len(messages)} history messages")
 
+        # Local bindings for the per-message loop
+        fromisoformat = datetime.fromisoformat
+        append = self._display_buffer.append
+        username = self.username
+        encrypt_label = ("🔒 Encrypted | ", 'encrypt_label')
         for msg in messages:
             sender = msg.get('sender')
             text = msg.get('text')
             timestamp = msg.get('timestamp', '')
 
             try:
-                from datetime import datetime
-                dt = datetime.fromisoformat(timestamp)
-                time_str = dt.strftime("%H:%M:%S")
-            except:
+                dt = fromisoformat(timestamp)
+                time_str = "%02d:%02d:%02d" % (dt.hour, dt.minute, dt.second)
+            except (ValueError, TypeError):
                 time_str = "00:00:00"
 
-            self.chat_display.config(state=tk.NORMAL)
-            self.chat_display.insert(tk.END, f"[{time_str}] ", 'timestamp')
-            self.chat_display.insert(tk.END, f"🔒 Encrypted | ", 'encrypt_label')
+            append((f"[{time_str}] ", 'timestamp'))
+            append(encrypt_label)
 
             if is_group:
-                self.chat_display.insert(tk.END, f"{sender} @{other_user}: {text}\n", 'group')
+                append((f"{sender} @{other_user}: {text}\n", 'group'))
+            elif sender == username:
+                append((f"You to {other_user}: {text}\n", 'sent'))
             else:
-                if sender == self.username:
-                    self.chat_display.insert(tk.END, f"You to {other_user}: {text}\n", 'sent')
-                else:
-                    self.chat_display.insert(tk.END, f"{sender} (private): {text}\n", 'received')
+                append((f"{sender} (private): {text}\n", 'received'))
 
-            self.chat_display.config(state=tk.DISABLED)
-
-        self.chat_display.see(tk.END)
         if messages:
             self.display_message("[Previous messages loaded]", 'system')
 
     def display_message(self, text, msg_type='normal'):
-        """Display message in chat"""
-        self.chat_display.config(state=tk.NORMAL)
-        from datetime import datetime
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        """Display message in chat (flushed immediately unless a UI batch is running)"""
+        lines = self._display_buffer
+        now = datetime.now()
+        timestamp = "%02d:%02d:%02d" % (now.hour, now.minute, now.second)
 
         if msg_type == 'encrypted_header':
-            self.chat_display.insert(tk.END, f"\n{'=' * 60}\n", 'header')
-            self.chat_display.insert(tk.END, f"          🔐 ENCRYPTED-CHAT          \n", 'encrypted_header')
-            self.chat_display.insert(tk.END, f"{'=' * 60}\n\n", 'header')
+            lines.append((f"\n{'=' * 60}\n", 'header'))
+            lines.append((f"          🔐 ENCRYPTED-CHAT          \n", 'encrypted_header'))
+            lines.append((f"{'=' * 60}\n\n", 'header'))
         elif msg_type == 'sent':
-            self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-            self.chat_display.insert(tk.END, f"🔒 Encrypted | ", 'encrypt_label')
-            self.chat_display.insert(tk.END, f"{text}\n", 'sent')
+            lines.append((f"[{timestamp}] ", 'timestamp'))
+            lines.append((f"🔒 Encrypted | ", 'encrypt_label'))
+            lines.append((f"{text}\n", 'sent'))
         elif msg_type == 'received':
-            self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-            self.chat_display.insert(tk.END, f"🔒 Encrypted | ", 'encrypt_label')
-            self.chat_display.insert(tk.END, f"{text}\n", 'received')
+            lines.append((f"[{timestamp}] ", 'timestamp'))
+            lines.append((f"🔒 Encrypted | ", 'encrypt_label'))
+            lines.append((f"{text}\n", 'received'))
         elif msg_type == 'group':
-            self.chat_display.insert(tk.END, f"[{timestamp}] ", 'timestamp')
-            self.chat_display.insert(tk.END, f"🔒 Encrypted | ", 'encrypt_label')
-            self.chat_display.insert(tk.END, f"{text}\n", 'group')
+            lines.append((f"[{timestamp}] ", 'timestamp'))
+            lines.append((f"🔒 Encrypted | ", 'encrypt_label'))
+            lines.append((f"{text}\n", 'group'))
         elif msg_type == 'system':
-            self.chat_display.insert(tk.END, f"[{timestamp}] {text}\n", 'system')
+            lines.append((f"[{timestamp}] {text}\n", 'system'))
         elif msg_type == 'error':
-            self.chat_display.insert(tk.END, f"[{timestamp}] {text}\n", 'error')
+            lines.append((f"[{timestamp}] {text}\n", 'error'))
         else:
-            self.chat_display.insert(tk.END, f"[{timestamp}] {text}\n")
+            lines.append((f"[{timestamp}] {text}\n", ()))
 
-        self.chat_display.tag_config('timestamp', foreground='gray', font=('Arial', 9))
-        self.chat_display.tag_config('encrypt_label', foreground='#27ae60', font=('Arial', 10, 'bold italic'))
-        self.chat_display.tag_config('sent', foreground='#2980b9', font=('Arial', 11))
-        self.chat_display.tag_config('received', foreground='#27ae60', font=('Arial', 11))
-        self.chat_display.tag_config('group', foreground='#8e44ad', font=('Arial', 11))
-        self.chat_display.tag_config('system', foreground='#95a5a6', font=('Arial', 10, 'italic'))
-        self.chat_display.tag_config('error', foreground='#e74c3c', font=('Arial', 10, 'bold'))
-        self.chat_display.tag_config('encrypted_header', foreground='#27ae60', font=('Arial', 16, 'bold'))
-        self.chat_display.tag_config('header', foreground='#7f8c8d')
-
-        self.chat_display.config(state=tk.DISABLED)
-        self.chat_display.see(tk.END)
+        if not self._batching:
+            self._flush_display()
     
-    def send_encrypted_data(self, message_str):
+    def send_encrypted_data(self, message_str, payload=None):
         """
         Send encrypted message to server
         Args:
-            message_str: Message string to send (will be encrypted if encryption is enabled)
+            message_str: Message bytes (JSON or packed) to send
+                (will be encrypted if encryption is enabled)
+            payload: Raw binary payload sent in the same frame (optional)
         """
         try:
             if config.USE_ENCRYPTION and self.encryption.is_ready():
-                encrypted_msg = self.encryption.encrypt_message(message_str)
-                self.socket.send(encrypted_msg.encode())
+                # Raw nonce + ciphertext, no base64: the frame is length-prefixed
+                nonce, ciphertext = self.encryption.seal(frame_body(message_str, payload))
+                with self._send_lock:
+                    send_sealed_frame(self.socket, nonce, ciphertext)
             else:
-                self.socket.send(message_str.encode())
+                with self._send_lock:
+                    send_frame(self.socket, message_str, payload)
         except Exception as e:
             print(f"[CLIENT ERROR] Failed to send encrypted data: {e}")
             raise
@@ -542,46 +762,109 @@ class ClassChatClient:
                                 f"File attached: {os.path.basename(filename)}\nClick 'File Send' to send it.")
 
     def send_attached_file(self):
-        """Send attached file"""
+        """
+        Send attached file.
+        Reading, encrypting and sending run on a worker thread so the Tk
+        main loop stays responsive during large transfers.
+        """
         if not self.file_to_send or not self.current_recipient:
             return
+        if self._file_sender and self._file_sender.is_alive():
+            messagebox.showwarning("File Transfer", "Another file is still being sent")
+            return
         try:
             file_size = os.path.getsize(self.file_to_send)
             if file_size > config.MAX_FILE_SIZE:
                 messagebox.showerror("File Too Large", f"File size exceeds {config.MAX_FILE_SIZE / (1024 * 1024)}MB")
                 return
-            with open(self.file_to_send, 'rb') as f:
-                file_data = base64.b64encode(f.read()).decode()
-            base_filename = os.path.basename(self.file_to_send)
-            if self.current_chat_type == 'group':
-                msg = Message.create_file_message(self.username, self.current_recipient, base_filename, file_data)
-                msg_dict = json.loads(msg)
-                msg_dict['is_group'] = True
-                msg = json.dumps(msg_dict)
-            else:
-                msg = Message.create_file_message(self.username, self.current_recipient, base_filename, file_data)
+        except OSError as e:
+            messagebox.showerror("File Transfer Error", f"Failed to send file: {e}")
+            return
+
+        self._file_sender = threading.Thread(
+            target=self._stream_file,
+            args=(self.file_to_send, file_size, self.current_recipient, self.current_chat_type == 'group'),
+            daemon=True
+        )
+        self._file_sender.start()
+        self.file_to_send = None
+        self.send_file_btn.config(state=tk.DISABLED, bg='SystemButtonFace', fg='black')
+
+    def _stream_file(self, path, file_size, recipient, is_group):
+        """Stream a file to the server one chunk per frame (file sender thread)"""
+        try:
+            base_filename = os.path.basename(path)
+            chunk_size = config.CHUNK_SIZE
+            chunks = (file_size + chunk_size - 1) // chunk_size
+            msg = Message.create_file_message(self.username, recipient, base_filename, file_size,
+                                              is_group=is_group, chunks=chunks)
+            chunk_msg = Message.create_file_chunk_message(self.username, recipient)
             self.send_encrypted_data(msg)
-            self.display_message(f"📎 Sent file '{base_filename}' to {self.current_recipient}", 'system')
-            self.file_to_send = None
-            self.send_file_btn.config(state=tk.DISABLED, bg='SystemButtonFace', fg='black')
+
+            # Stream the file one chunk per frame (constant memory, whatever the file size).
+            # The send lock is taken per chunk, so chat messages can go out in between.
+            with open(path, 'rb') as f:
+                if config.USE_ENCRYPTION and self.encryption.is_ready():
+                    # Each chunk is read into one reused buffer and sealed as its own frame
+                    bodies = iter_file_bodies(f, chunk_msg, chunk_size)
+                    for sealed in self.encryption.encrypt_stream(bodies):
+                        with self._send_lock:
+                            send_frame(self.socket, sealed)
+                else:
+                    # Unencrypted: stream file bytes straight from disk (zero-copy)
+                    for offset in range(0, file_size, chunk_size):
+                        with self._send_lock:
+                            send_file_frame(self.socket, chunk_msg, f,
+                                            min(chunk_size, file_size - offset), offset)
+            self._call_in_ui(self.display_message, f"📎 Sent file '{base_filename}' to {recipient}", 'system')
         except Exception as e:
-            messagebox.showerror("File Transfer Error", f"Failed to send file: {e}")
+            self._call_in_ui(messagebox.showerror, "File Transfer Error", f"Failed to send file: {e}")
 
-    def handle_received_file(self, message):
-        """Handle received file"""
+    def begin_received_file(self, message):
+        """Start receiving a file; its chunks are spooled to a temporary file"""
+        sender = message.get('sender')
+        chunks = message.get('data', {}).get('chunks', 0)
+        self.discard_received_file(sender)
+        spool = tempfile.NamedTemporaryFile(prefix='classchat_', delete=False)
+        self._incoming_files[sender] = [message, spool, chunks]
+        if not chunks:
+            self.handle_received_file(sender)
+
+    def handle_file_chunk(self, message):
+        """Append one received chunk to the sender's spooled file"""
         sender = message.get('sender')
+        transfer = self._incoming_files.get(sender)
+        if transfer is None:
+            # File from a conversation that is not open - ignored with its header
+            return
+        transfer[1].write(message.get('payload', b''))
+        transfer[2] -= 1
+        if transfer[2] <= 0:
+            self.handle_received_file(sender)
+
+    def discard_received_file(self, sender):
+        """Drop an unfinished incoming file and its temporary spool"""
+        transfer = self._incoming_files.pop(sender, None)
+        if transfer:
+            transfer[1].close()
+            os.remove(transfer[1].name)
+
+    def handle_received_file(self, sender):
+        """Handle completely received file"""
+        message, spool, _ = self._incoming_files.pop(sender)
+        spool.close()
         data = message.get('data', {})
         filename = data.get('filename', 'unknown')
-        file_data_b64 = data.get('filedata', '')
         save_path = filedialog.asksaveasfilename(title="Save received file", initialfile=filename)
-        if save_path:
-            try:
-                file_data = base64.b64decode(file_data_b64)
-                with open(save_path, 'wb') as f:
-                    f.write(file_data)
+        try:
+            if save_path:
+                shutil.move(spool.name, save_path)
                 self.display_message(f"📎 File '{filename}' received from {sender} and saved", 'system')
-            except Exception as e:
-                messagebox.showerror("File Save Error", f"Failed to save file: {e}")
+        except Exception as e:
+            messagebox.showerror("File Save Error", f"Failed to save file: {e}")
+        finally:
+            if os.path.exists(spool.name):
+                os.remove(spool.name)
 
     def request_conversation_history(self, other_user, is_group=False):
         """Request conversation history from server"""
@@ -605,9 +888,7 @@ class ClassChatClient:
         """Handle user double-click - LOAD HISTORY"""
         selection = self.users_listbox.curselection()
         if selection:
-            user_text = self.users_listbox.get(selection[0])
-            user = user_text.split('(')[0].strip() if '(' in user_text else user_text.strip()
-            user = user.replace('🟢', '').replace('🔴', '').strip()
+            user = self._users_by_index[selection[0]]
             if user != self.username:
                 # SWITCH CONVERSATION
                 self.current_recipient = user
@@ -629,8 +910,7 @@ class ClassChatClient:
         """Handle group double-click"""
         selection = self.groups_listbox.curselection()
         if selection:
-            group_text = self.groups_listbox.get(selection[0])
-            group = group_text.replace('👥', '').strip()
+            group = self._groups_by_index[selection[0]]
 
             dialog = tk.Toplevel(self.root)
             dialog.title("Join Group")
@@ -673,31 +953,79 @@ class ClassChatClient:
             tk.Button(dialog, text="Cancel", font=('Arial', 10), bg='#95a5a6', fg='white',
                       width=15, command=dialog.destroy, cursor='hand2').pack(pady=(0, 10))
 
+    @throttle(config.UI_THROTTLE_MS)
     def refresh_users(self):
-        """Refresh users list"""
+        """Refresh users list (full snapshot; deltas keep it current afterwards)"""
         if self.connected:
             msg = Message.create_message(config.MSG_LIST_USERS, self.username)
             self.send_encrypted_data(msg)
 
+    @throttle(config.UI_THROTTLE_MS)
     def refresh_groups(self):
-        """Refresh groups list"""
+        """Refresh groups list (full snapshot; deltas keep it current afterwards)"""
         if self.connected:
             msg = Message.create_message(config.MSG_LIST_GROUPS, self.username)
             self.send_encrypted_data(msg)
 
     def update_users_list(self, users):
-        """Update users list"""
-        self.users_listbox.delete(0, tk.END)
-        for user in users:
-            if user['username'] != self.username:
-                status_icon = "🟢" if user['status'] == 'online' else "🔴"
-                self.users_listbox.insert(tk.END, f"{status_icon} {user['username']} ({user['status']})")
+        """Replace the users cache with a full snapshot from the server"""
+        self._online_users = {user['username']: user['status'] for user in users}
+        self._render_users()
 
     def update_groups_list(self, groups):
-        """Update groups list"""
-        self.groups_listbox.delete(0, tk.END)
-        for group in groups:
-            self.groups_listbox.insert(tk.END, f"👥 {group['name']}")
+        """Replace the groups cache with a full snapshot from the server"""
+        self._groups = {group['name']: group.get('creator') for group in groups}
+        self._render_groups()
+
+    @throttle(config.UI_THROTTLE_MS)
+    def _render_users(self):
+        """Show the users cache (display strings in the listbox, raw names in _users_by_index)"""
+        lines = {
+            username: f"{'🟢' if status == 'online' else '🔴'} {username} ({status})"
+            for username, status in self._online_users.items() if username != self.username
+        }
+        self._sync_listbox(self.users_listbox, self._users_by_index, self._users_view, lines)
+
+    @throttle(config.UI_THROTTLE_MS)
+    def _render_groups(self):
+        """Show the groups cache (display strings in the listbox, raw names in _groups_by_index)"""
+        lines = {name: f"👥 {name}" for name in self._groups}
+        self._sync_listbox(self.groups_listbox, self._groups_by_index, self._groups_view, lines)
+
+    def _sync_listbox(self, listbox, names, view, lines):
+        """
+        Apply only the difference between what a listbox shows and `lines`
+        (one Tk call per removed/changed row, one for all new rows)
+
+        Args:
+            listbox: Listbox to update
+            names: Names by row index (updated in place)
+            view: Name -> currently displayed line (updated in place)
+            lines: Name -> wanted line; new names are appended in this order
+        """
+        # Removed rows, bottom-up so the remaining indices stay valid
+        for index in range(len(names) - 1, -1, -1):
+            name = names[index]
+            if name not in lines:
+                listbox.delete(index)
+                del names[index]
+                del view[name]
+
+        # Changed rows (e.g. status flip), replaced in place
+        for index, name in enumerate(names):
+            line = lines[name]
+            if view[name] != line:
+                listbox.delete(index)
+                listbox.insert(index, line)
+                view[name] = line
+
+        # New rows
+        added = [name for name in lines if name not in view]
+        if added:
+            listbox.insert(tk.END, *(lines[name] for name in added))
+            names.extend(added)
+            for name in added:
+                view[name] = lines[name]
 
     def create_group_dialog(self):
         """Show create group dialog"""
@@ -715,7 +1043,7 @@ class ClassChatClient:
                                              {"group_name": group_name})
                 self.send_encrypted_data(msg)
                 dialog.destroy()
-                self.refresh_groups()
+                # The new group arrives as a GROUP_DELTA push, no refresh needed
 
         tk.Button(dialog, text="Create", command=create).pack(pady=10)
 
@@ -784,7 +1112,15 @@ class ClassChatClient:
             except:
                 pass
             self.connected = False
+            # Wake the receive thread blocked in poll()
+            if self._shutdown_w:
+                try:
+                    self._shutdown_w.send(b'x')
+                except OSError:
+                    pass
             if self.socket:
+                if self.io_multiplexer:
+                    self.io_multiplexer.unregister(self.socket)
                 self.socket.close()
 
     def run(self):
@@ -6,6 +6,17 @@ Configuration settings for ClassChat Project
 SERVER_HOST = '127.0.0.1'  # localhost
 SERVER_PORT = 5555
 BUFFER_SIZE = 131072  # Change to 128 KB
+SERVER_WORKERS = 8  # Worker threads handling ready client sockets
+LOCK_SHARDS = 8  # Per-user lock stripes in the server (power of two)
+SERVER_READ_BUFFER = 16 * 1024  # Initial per-client receive buffer (grows for big frames, shrinks when drained)
+HANDSHAKE_TIMEOUT = 10  # Seconds a new connection may take to finish CONNECT/key exchange (server and client)
+SEND_TIMEOUT = 5  # Seconds a send may wait on a client that stopped reading before it is dropped
+READY_PORT_ENV = 'CLASSCHAT_READY_PORT'  # Env var: loopback port the server connects to once it listens
+
+# Socket Tuning
+TCP_NODELAY = True  # Disable Nagle's algorithm for low-latency chat messages
+TCP_RCVBUF_OVERRIDE = None  # Bytes; None keeps the kernel's buffer autotuning
+TCP_SNDBUF_OVERRIDE = None  # Bytes; None keeps the kernel's buffer autotuning
 
 # Message Types
 MSG_CONNECT = "CONNECT"
@@ -13,6 +24,7 @@ MSG_DISCONNECT = "DISCONNECT"
 MSG_PRIVATE = "PRIVATE"
 MSG_GROUP = "GROUP"
 MSG_FILE = "FILE"
+MSG_FILE_CHUNK = "FILE_CHUNK"  # One chunk of an in-progress file transfer
 MSG_CREATE_GROUP = "CREATE_GROUP"
 MSG_JOIN_GROUP = "JOIN_GROUP"
 MSG_LIST_USERS = "LIST_USERS"
@@ -26,25 +38,41 @@ MSG_USER_STATUS = "USER_STATUS"  # Check if user exists
 MSG_HISTORY_REQUEST = "HISTORY_REQUEST"  # NEW: Request conversation history
 MSG_HISTORY_RESPONSE = "HISTORY_RESPONSE"  # NEW: Send conversation history
 MSG_KEY_EXCHANGE = "KEY_EXCHANGE"  # Encryption key exchange
+MSG_USER_DELTA = "USER_DELTA"  # Server push: a user came online / went offline
+MSG_GROUP_DELTA = "GROUP_DELTA"  # Server push: a group was created
 
 
 
 # File Transfer
 MAX_FILE_SIZE = 10 * 1024 * 1024
-CHUNK_SIZE = 4096
+CHUNK_SIZE = 64 * 1024  # File data per FILE_CHUNK frame
+MAX_FRAME_SIZE = MAX_FILE_SIZE + 64 * 1024  # File payload plus header/encryption overhead
 
 
 # Encryption
 USE_ENCRYPTION = True
 
 
+# Debugging
+DEBUG_PROTOCOL = False  # Log the type of every parsed message to stderr
+LOG_LEVEL = 'INFO'  # Server log level; 'DEBUG' adds per-message database detail
+
+
 # Database
 DB_FILE = 'classchat.db'
+DB_BATCH_SIZE = 64  # Max rows committed per write batch
+DB_BATCH_INTERVAL = 0.02  # Max seconds a queued row waits before commit
+DB_STATEMENT_CACHE = 256  # Prepared statements kept per connection
 
 
 # I/O Multiplexing Options
-IO_METHOD = 'select'  # Options: 'select', 'poll', 'epoll'
+IO_METHOD = 'auto'  # Options: 'auto' (epoll > poll > select), 'select', 'poll', 'epoll'
 
 # Message History
 HISTORY_MESSAGE_LIMIT = 20  # Number of previous messages to load
 
+# Client GUI
+UI_DRAIN_INTERVAL_MS = 30  # Queue polling interval, used only when Tcl is not threaded
+UI_THROTTLE_MS = 150  # Minimum interval between list refreshes/repaints
+
+
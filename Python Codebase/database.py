@@ -4,23 +4,134 @@ Stores ALL messages for conversation thread persistence
 """
 
 import sqlite3
-import json
+import logging
+import queue
+import threading
+import time
 from datetime import datetime
 import config
 
+# Written through the server's queued log handler (see server.py)
+log = logging.getLogger("classchat.database")
+
+# Hot-path statements, kept as constants so every call passes the exact same
+# text and hits the connection's prepared-statement cache
+_SQL_INSERT_HISTORY = '''
+    INSERT INTO message_history 
+    (sender, receiver, message_type, message_text, timestamp, is_group, group_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+_SQL_INSERT_OFFLINE = '''
+    INSERT INTO offline_messages 
+    (receiver, sender, message_type, content, timestamp, is_group, group_name)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+# One index range scan per direction, each already newest-first,
+# so neither branch needs a sort; only the 2*limit rows are merged.
+_SQL_CONVERSATION_HISTORY = '''
+    SELECT * FROM (
+        SELECT sender, receiver, message_text, timestamp, message_type
+        FROM message_history
+        WHERE sender = ? AND receiver = ? AND is_group = 0
+        ORDER BY timestamp DESC
+        LIMIT ?
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT sender, receiver, message_text, timestamp, message_type
+        FROM message_history
+        WHERE sender = ? AND receiver = ? AND is_group = 0
+        ORDER BY timestamp DESC
+        LIMIT ?
+    )
+    ORDER BY timestamp DESC
+    LIMIT ?
+'''
+
+_SQL_GROUP_HISTORY = '''
+    SELECT sender, message_text, timestamp
+    FROM message_history
+    WHERE is_group = 1 AND group_name = ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+'''
+
+_SQL_OFFLINE_MESSAGES = '''
+    SELECT id, sender, message_type AS type, content, timestamp
+    FROM offline_messages
+    WHERE receiver = ? AND delivered = 0
+    ORDER BY timestamp
+'''
+
+_SQL_COUNT_UNDELIVERED = 'SELECT COUNT(*) FROM offline_messages WHERE receiver = ? AND delivered = 0'
+_SQL_MARK_DELIVERED = 'UPDATE offline_messages SET delivered = 1 WHERE id = ?'
+_SQL_USER_EXISTS = 'SELECT COUNT(*) FROM users WHERE username = ?'
+_SQL_UPSERT_USER = '''
+    INSERT INTO users (username, registered_at, last_seen) VALUES (?, ?, ?)
+    ON CONFLICT(username) DO UPDATE SET last_seen = excluded.last_seen
+'''
+_SQL_GROUP_MEMBERS = 'SELECT username FROM group_members WHERE group_name = ?'
+_SQL_ADD_GROUP_MEMBER = '''
+    INSERT OR IGNORE INTO group_members (group_name, username, joined_at) VALUES (?, ?, ?)
+'''
+_SQL_IS_GROUP_MEMBER = 'SELECT COUNT(*) FROM group_members WHERE group_name = ? AND username = ?'
+
 
 class MessageDatabase:
     """Handles message history, offline messages, users and groups"""
     
     def __init__(self, db_file=config.DB_FILE):
-        """Initialize database connection"""
+        """
+        Initialize database connection.
+        One write connection is opened for the server's lifetime and shared by
+        all threads; the RLock serializes access to it. Reads go through a
+        connection per thread (see _reader), which WAL lets run alongside the
+        writer, so they never wait for a write or for each other.
+        """
         self.db_file = db_file
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False,
+                                     cached_statements=config.DB_STATEMENT_CACHE)
+        self._lock = threading.RLock()
+        self._local = threading.local()  # .conn: this thread's read connection
+        self._readers = []  # every read connection, closed with the database
+        
+        # Connection-wide settings, applied once
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA temp_store=MEMORY')
+        self._conn.execute('PRAGMA cache_size=-20000')  # ~20 MB page cache
+        
         self.init_database()
     
+    def close(self):
+        """Close the database connections (server shutdown)"""
+        with self._lock:
+            for conn in self._readers:
+                conn.close()
+            self._conn.close()
+    
+    def _reader(self):
+        """Return this thread's read connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, check_same_thread=False,
+                                   cached_statements=config.DB_STATEMENT_CACHE)
+            conn.execute('PRAGMA temp_store=MEMORY')
+            self._local.conn = conn
+            with self._lock:
+                self._readers.append(conn)
+        return conn
+    
     def init_database(self):
         """Create database tables if they don't exist"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        with self._lock, self._conn:
+            self._create_tables(self._conn.cursor())
+        log.info("[DATABASE] Database initialized with message history support")
+    
+    def _create_tables(self, cursor):
+        """Create tables and indexes"""
         
         # Create registered users table
         cursor.execute('''
@@ -88,42 +199,37 @@ class MessageDatabase:
             ON message_history(sender, receiver, timestamp)
         ''')
         
-        conn.commit()
-        conn.close()
-        print("[DATABASE] Database initialized with message history support")
+        # Index for group history (newest-first scan per group)
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_message_history_group 
+            ON message_history(group_name, timestamp)
+        ''')
     
     def register_user(self, username):
         """Register a new user or update last_seen"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        try:
-            timestamp = datetime.now().isoformat()
-            cursor.execute('''
-                INSERT INTO users (username, registered_at, last_seen)
-                VALUES (?, ?, ?)
-            ''', (username, timestamp, timestamp))
-            conn.commit()
-            print(f"[DATABASE] User '{username}' registered")
-        except sqlite3.IntegrityError:
-            # User exists, update last_seen
-            cursor.execute('''
-                UPDATE users SET last_seen = ? WHERE username = ?
-            ''', (datetime.now().isoformat(), username))
-            conn.commit()
+        timestamp = datetime.now().isoformat()
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute('''
+                        INSERT INTO users (username, registered_at, last_seen)
+                        VALUES (?, ?, ?)
+                    ''', (username, timestamp, timestamp))
+                log.info("[DATABASE] User '%s' registered", username)
+            except sqlite3.IntegrityError:
+                # User exists, update last_seen
+                with self._conn:
+                    self._conn.execute('''
+                        UPDATE users SET last_seen = ? WHERE username = ?
+                    ''', (timestamp, username))
         
-        conn.close()
         return True
     
     def user_exists(self, username):
         """Check if user is registered"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT COUNT(*) FROM users WHERE username = ?', (username,))
+        cursor = self._reader().execute(_SQL_USER_EXISTS, (username,))
         count = cursor.fetchone()[0]
         
-        conn.close()
         return count > 0
     
     def store_message(self, sender, receiver, message_text, message_type=config.MSG_PRIVATE, 
@@ -131,21 +237,24 @@ class MessageDatabase:
         """
         Store a message in history (for ALL messages, not just offline)
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
         timestamp = datetime.now().isoformat()
         
-        cursor.execute('''
-            INSERT INTO message_history 
-            (sender, receiver, message_type, message_text, timestamp, is_group, group_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (sender, receiver, message_type, message_text, timestamp, 
-              1 if is_group else 0, group_name))
+        with self._lock, self._conn:
+            self._conn.execute(_SQL_INSERT_HISTORY, (sender, receiver, message_type, message_text, timestamp, 
+                  1 if is_group else 0, group_name))
         
-        conn.commit()
-        conn.close()
-        print(f"[DATABASE] Stored message: {sender} -> {receiver}")
+        log.info("[DATABASE] Stored message: %s -> %s", sender, receiver)
+    
+    def store_messages_bulk(self, rows):
+        """
+        Store many history rows in one transaction
+        
+        Args:
+            rows: (sender, receiver, message_type, message_text, timestamp,
+                   is_group, group_name) tuples
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(_SQL_INSERT_HISTORY, rows)
     
     def get_conversation_history(self, user1, user2, limit=20):
         """
@@ -159,23 +268,12 @@ class MessageDatabase:
         Returns:
             List of messages ordered by timestamp
         """
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
         # Get messages where user1 and user2 are involved (bidirectional)
-        cursor.execute('''
-            SELECT sender, receiver, message_text, timestamp, message_type
-            FROM message_history
-            WHERE is_group = 0 AND (
-                (sender = ? AND receiver = ?) OR
-                (sender = ? AND receiver = ?)
-            )
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (user1, user2, user2, user1, limit))
+        cursor = self._reader().execute(_SQL_CONVERSATION_HISTORY, (user1, user2, limit, user2, user1, limit, limit))
+        rows = cursor.fetchall()
         
         messages = []
-        for row in cursor.fetchall():
+        for row in rows:
             messages.append({
                 'sender': row[0],
                 'receiver': row[1],
@@ -187,25 +285,16 @@ class MessageDatabase:
         # Reverse to show oldest first
         messages.reverse()
         
-        conn.close()
-        print(f"[DATABASE] Retrieved {len(messages)} messages for conversation {user1} <-> {user2}")
+        log.info("[DATABASE] Retrieved %s messages for conversation %s <-> %s", len(messages), user1, user2)
         return messages
     
     def get_group_history(self, group_name, limit=20):
         """Get message history for a group"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT sender, message_text, timestamp
-            FROM message_history
-            WHERE is_group = 1 AND group_name = ?
-            ORDER BY timestamp DESC
-            LIMIT ?
-        ''', (group_name, limit))
+        cursor = self._reader().execute(_SQL_GROUP_HISTORY, (group_name, limit))
+        rows = cursor.fetchall()
         
         messages = []
-        for row in cursor.fetchall():
+        for row in rows:
             messages.append({
                 'sender': row[0],
                 'text': row[1],
@@ -214,167 +303,297 @@ class MessageDatabase:
         
         messages.reverse()
         
-        conn.close()
-        print(f"[DATABASE] Retrieved {len(messages)} messages for group {group_name}")
+        log.info("[DATABASE] Retrieved %s messages for group %s", len(messages), group_name)
         return messages
     
     def store_offline_message(self, receiver, sender, message_type, content, 
                              is_group=False, group_name=None):
 
         """Store an offline message"""
-        print(f"[DATABASE DEBUG] Storing offline message: {sender} -> {receiver}" + 
-              (f" (Group: {group_name})" if is_group else ""))
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
+        log.debug("[DATABASE DEBUG] Storing offline message: %s -> %s%s", sender, receiver,
+                  f" (Group: {group_name})" if is_group else "")
         timestamp = datetime.now().isoformat()
         
-        cursor.execute('''
-            INSERT INTO offline_messages 
-            (receiver, sender, message_type, content, timestamp, is_group, group_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (receiver, sender, message_type, content, timestamp, 
-              1 if is_group else 0, group_name))
-        
-        conn.commit()
-        cursor.execute('SELECT COUNT(*) FROM offline_messages WHERE receiver = ? AND delivered = 0', 
-                      (receiver,))
-        count = cursor.fetchone()[0]
-        print(f"[DATABASE DEBUG] Total undelivered messages for '{receiver}': {count}")
+        with self._lock:
+            with self._conn:
+                self._conn.execute(_SQL_INSERT_OFFLINE, (receiver, sender, message_type, content, timestamp, 
+                      1 if is_group else 0, group_name))
+            
+            cursor = self._conn.execute(_SQL_COUNT_UNDELIVERED, (receiver,))
+            count = cursor.fetchone()[0]
+        log.debug("[DATABASE DEBUG] Total undelivered messages for '%s': %s", receiver, count)
+    
+    def store_offline_messages_bulk(self, rows):
+        """
+        Store many offline messages in one transaction
         
-        conn.close()
+        Args:
+            rows: (receiver, sender, message_type, content, timestamp,
+                   is_group, group_name) tuples
+        """
+        with self._lock, self._conn:
+            self._conn.executemany(_SQL_INSERT_OFFLINE, rows)
     
     def get_offline_messages(self, username):
-        """Retrieve all offline messages for a user"""
-        print(f"[DATABASE DEBUG] Retrieving offline messages for '{username}'")
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        """
+        Retrieve all offline messages for a user
         
-        cursor.execute('''
-            SELECT id, sender, message_type, content, timestamp
-            FROM offline_messages
-            WHERE receiver = ? AND delivered = 0
-            ORDER BY timestamp
-        ''', (username,))
+        Returns:
+            List of sqlite3.Row (keys: id, sender, type, content, timestamp);
+            rows are only read by the server, so no dicts are built
+        """
+        log.debug("[DATABASE DEBUG] Retrieving offline messages for '%s'", username)
+        cursor = self._reader().cursor()
+        cursor.row_factory = sqlite3.Row
+        cursor.execute(_SQL_OFFLINE_MESSAGES, (username,))
+        messages = cursor.fetchall()
         
-        messages = []
-        for row in cursor.fetchall():
-            messages.append({
-                'id': row[0],
-                'sender': row[1],
-                'type': row[2],
-                'content': row[3],
-                'timestamp': row[4]
-            })
-            print(f"[DATABASE DEBUG] Retrieved message ID {row[0]} from {row[1]}")
+        if log.isEnabledFor(logging.DEBUG):
+            for row in messages:
+                log.debug("[DATABASE DEBUG] Retrieved message ID %s from %s", row['id'], row['sender'])
         
-        print(f"[DATABASE DEBUG] Total messages retrieved: {len(messages)}")
-        conn.close()
+        log.debug("[DATABASE DEBUG] Total messages retrieved: %s", len(messages))
         return messages
     
     def mark_messages_delivered(self, username):
         """Mark all messages for a user as delivered"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE offline_messages
-            SET delivered = 1
-            WHERE receiver = ? AND delivered = 0
-        ''', (username,))
+        with self._lock, self._conn:
+            self._conn.execute('''
+                UPDATE offline_messages
+                SET delivered = 1
+                WHERE receiver = ? AND delivered = 0
+            ''', (username,))
+    
+    def write_batch(self, history_rows=(), offline_rows=(), delivered_ids=(), user_rows=(),
+                    member_rows=()):
+        """
+        Apply one writer batch in a single transaction (one commit/fsync)
         
-        conn.commit()
-        conn.close()
+        Args:
+            history_rows: Rows for store_messages_bulk
+            offline_rows: Rows for store_offline_messages_bulk
+            delivered_ids: offline_messages ids to mark as delivered
+            user_rows: (username, registered_at, last_seen) to register or refresh
+            member_rows: (group_name, username, joined_at) to add (existing ones are skipped)
+        """
+        with self._lock, self._conn:
+            if user_rows:
+                self._conn.executemany(_SQL_UPSERT_USER, user_rows)
+            if member_rows:
+                self._conn.executemany(_SQL_ADD_GROUP_MEMBER, member_rows)
+            if history_rows:
+                self._conn.executemany(_SQL_INSERT_HISTORY, history_rows)
+            if offline_rows:
+                self._conn.executemany(_SQL_INSERT_OFFLINE, offline_rows)
+            if delivered_ids:
+                self._conn.executemany(_SQL_MARK_DELIVERED,
+                                       [(message_id,) for message_id in delivered_ids])
     
     def create_group(self, group_name, creator):
         """Create a new group"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
         timestamp = datetime.now().isoformat()
         
         try:
-            cursor.execute('''
-                INSERT INTO groups (group_name, creator, created_at)
-                VALUES (?, ?, ?)
-            ''', (group_name, creator, timestamp))
-            
-            cursor.execute('''
-                INSERT INTO group_members (group_name, username, joined_at)
-                VALUES (?, ?, ?)
-            ''', (group_name, creator, timestamp))
-            
-            conn.commit()
-            conn.close()
+            # Both inserts commit together (or roll back together)
+            with self._lock, self._conn:
+                self._conn.execute('''
+                    INSERT INTO groups (group_name, creator, created_at)
+                    VALUES (?, ?, ?)
+                ''', (group_name, creator, timestamp))
+                
+                self._conn.execute('''
+                    INSERT INTO group_members (group_name, username, joined_at)
+                    VALUES (?, ?, ?)
+                ''', (group_name, creator, timestamp))
             return True
         except sqlite3.IntegrityError:
-            conn.close()
             return False
     
     def add_group_member(self, group_name, username):
         """Add a user to a group"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
         try:
             timestamp = datetime.now().isoformat()
-            cursor.execute('''
-                INSERT INTO group_members (group_name, username, joined_at)
-                VALUES (?, ?, ?)
-            ''', (group_name, username, timestamp))
-            conn.commit()
-            print(f"[DATABASE] Added '{username}' to group '{group_name}'")
+            with self._lock, self._conn:
+                self._conn.execute('''
+                    INSERT INTO group_members (group_name, username, joined_at)
+                    VALUES (?, ?, ?)
+                ''', (group_name, username, timestamp))
+            log.info("[DATABASE] Added '%s' to group '%s'", username, group_name)
         except sqlite3.IntegrityError:
-            print(f"[DATABASE] '{username}' already in group '{group_name}'")
-        
-        conn.close()
+            log.info("[DATABASE] '%s' already in group '%s'", username, group_name)
     
     def get_group_members(self, group_name):
         """Get all members of a group"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT username FROM group_members WHERE group_name = ?
-        ''', (group_name,))
-        
+        cursor = self._reader().execute(_SQL_GROUP_MEMBERS, (group_name,))
         members = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        
         return members
     
+    def get_group_memberships(self):
+        """Get every group's members as {group_name: set of usernames}"""
+        reader = self._reader()
+        memberships = {row[0]: set() for row in reader.execute('SELECT group_name FROM groups').fetchall()}
+        for group_name, username in reader.execute('SELECT group_name, username FROM group_members').fetchall():
+            memberships.setdefault(group_name, set()).add(username)
+        
+        return memberships
+    
     def get_all_groups(self):
         """Get all groups"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        cursor = self._reader().execute('SELECT group_name, creator FROM groups')
+        rows = cursor.fetchall()
         
-        cursor.execute('SELECT group_name, creator FROM groups')
-        groups = [{'name': row[0], 'creator': row[1]} for row in cursor.fetchall()]
-        
-        conn.close()
+        groups = [{'name': row[0], 'creator': row[1]} for row in rows]
         return groups
     
     def is_group_member(self, group_name, username):
         """Check if user is a member of a group"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT COUNT(*)
-            FROM group_members
-            WHERE group_name = ? AND username = ?
-        ''', (group_name, username))
-        
+        cursor = self._reader().execute(_SQL_IS_GROUP_MEMBER, (group_name, username))
         count = cursor.fetchone()[0]
-        conn.close()
+        
         return count > 0
     
+    def get_usernames(self):
+        """Get the set of all registered usernames"""
+        cursor = self._reader().execute('SELECT username FROM users')
+        return {row[0] for row in cursor.fetchall()}
+    
     def get_all_users(self):
         """Get all registered users"""
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT username, registered_at, last_seen FROM users ORDER BY username')
+        cursor = self._reader().execute('SELECT username, registered_at, last_seen FROM users ORDER BY username')
         users = cursor.fetchall()
         
-        conn.close()
         return users
+
+
+class MessageWriter:
+    """
+    Background writer that batches history/offline-message INSERTs, user
+    registrations, group joins and delivery marks, keeping disk latency off the client
+    socket threads.
+    Server threads queue rows; one thread commits them, one transaction per
+    batch of at most DB_BATCH_SIZE rows or DB_BATCH_INTERVAL seconds.
+    """
+    
+    HISTORY = 0
+    OFFLINE = 1
+    DELIVERED = 2
+    USER = 3
+    MEMBER = 4
+    FLUSH = 5  # Not a row: an Event set once everything queued before it is committed
+    
+    def __init__(self, database, batch_size=config.DB_BATCH_SIZE,
+                 interval=config.DB_BATCH_INTERVAL):
+        """Start the writer thread for the given MessageDatabase"""
+        self.database = database
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+    
+    def store_message(self, sender, receiver, message_text, message_type=config.MSG_PRIVATE,
+                      is_group=False, group_name=None):
+        """Queue a message for the history table"""
+        self.queue.put((self.HISTORY, (sender, receiver, message_type, message_text,
+                                       datetime.now().isoformat(),
+                                       1 if is_group else 0, group_name)))
+    
+    def store_offline_message(self, receiver, sender, message_type, content,
+                              is_group=False, group_name=None):
+        """Queue an offline message"""
+        self.queue.put((self.OFFLINE, (receiver, sender, message_type, content,
+                                       datetime.now().isoformat(),
+                                       1 if is_group else 0, group_name)))
+    
+    def register_user(self, username):
+        """Queue a user registration (or last_seen update)"""
+        timestamp = datetime.now().isoformat()
+        self.queue.put((self.USER, (username, timestamp, timestamp)))
+    
+    def add_group_member(self, group_name, username):
+        """Queue a group join (a no-op if the user is already a member)"""
+        self.queue.put((self.MEMBER, (group_name, username, datetime.now().isoformat())))
+    
+    def mark_delivered(self, message_ids):
+        """Queue offline message ids (from get_offline_messages) to mark as delivered"""
+        for message_id in message_ids:
+            self.queue.put((self.DELIVERED, message_id))
+    
+    def flush(self):
+        """
+        Block until every row queued before this call has been committed.
+        The writer commits as soon as it reaches the marker instead of
+        waiting out its batch interval, and rows other threads queue after
+        it are not waited for (queue.join() could wait forever under load).
+        """
+        if not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put((self.FLUSH, done))
+        done.wait()
+    
+    def close(self):
+        """Commit what is queued and stop the writer thread"""
+        self.queue.put(None)
+        self.thread.join()
+    
+    def _run(self):
+        """Collect rows into batches and commit them"""
+        while True:
+            item = self.queue.get()
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            
+            while item is not None and item[0] != self.FLUSH and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+            
+            try:
+                self._write(batch)
+            except Exception as e:
+                log.error("[DATABASE ERROR] Batch write failed: %s", e)
+            finally:
+                for item in batch:
+                    self.queue.task_done()
+                    if item is not None and item[0] == self.FLUSH:
+                        item[1].set()
+            
+            if batch[-1] is None:
+                return
+    
+    def _write(self, batch):
+        """Commit one batch"""
+        history_rows = []
+        offline_rows = []
+        delivered_ids = []
+        user_rows = []
+        member_rows = []
+        for item in batch:
+            if item is None:
+                continue
+            kind, row = item
+            if kind == self.FLUSH:
+                continue
+            if kind == self.HISTORY:
+                history_rows.append(row)
+            elif kind == self.OFFLINE:
+                offline_rows.append(row)
+            elif kind == self.USER:
+                user_rows.append(row)
+            elif kind == self.MEMBER:
+                member_rows.append(row)
+            else:
+                delivered_ids.append(row)
+        
+        if history_rows or offline_rows or delivered_ids or user_rows or member_rows:
+            self.database.write_batch(history_rows, offline_rows, delivered_ids, user_rows,
+                                      member_rows)
+        if offline_rows:
+            log.info("[DATABASE] Stored %s offline message(s)", len(offline_rows))
@@ -1,74 +1,102 @@
 """
 Message Encryption Module for ClassChat
-Implement hybrid encryption: RSA for key exchange, AES for message encryption
+Implement hybrid encryption: X25519 ECDH for key exchange, AES for message encryption
 """
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from cryptography.hazmat.primitives.asymmetric import x25519
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.backends import default_backend
 import os
 import base64
+import itertools
+import struct
+
+
+# HKDF context label binding derived keys to this protocol
+SESSION_KEY_INFO = b'classchat-session-key'
+# Hash descriptors are stateless, so one instance serves every key derivation
+_HKDF_HASH = hashes.SHA256()
+
+# AES-GCM nonce size (96-bit, the size GCM is optimised for)
+NONCE_SIZE = 12
+TAG_SIZE = 16
+# Nonce = random 8-byte per-session prefix + 4-byte message counter: unique per
+# key without a getrandom() syscall per message. Each side picks its own
+# prefix, so the two directions sharing the session key do not collide.
+NONCE_PREFIX_SIZE = 8
+MAX_NONCE_COUNTER = 0xFFFFFFFF
+_pack_nonce_counter = struct.Struct('>I').pack
 
 
 class MessageEncryption:
-    """Handles RSA + AES hybrid encryption for secure communication"""
+    """Handles X25519 + AES hybrid encryption for secure communication"""
 
     def __init__(self):
         """Initialize encryption handler"""
         self.session_key = None  # AES session key (will be set after key exchange)
-        self.rsa_private_key = None  # Server's RSA private key
-        self.rsa_public_key = None  # Server's RSA public key (for client)
+        self._aead = None  # AESGCM cipher bound to the session key
+        self._nonce_prefix = None
+        self._nonce_counter = None  # itertools.count: next() is atomic across sender threads
         self.peer_public_key = None  # Peer's public key (if needed)
+        self.x25519_private_key = None  # X25519 key (server: static, client: ephemeral)
+        self.x25519_public_key = None
+        self._x25519_public_key_b64 = None  # Serialized once, keys are immutable
 
-    # ==================== RSA KEY MANAGEMENT ====================
-    
-    def generate_rsa_keys(self):
+    # ==================== X25519 KEY EXCHANGE ====================
+
+    def generate_x25519_keys(self):
         """
-        Generate RSA key pair (Server side)
+        Generate X25519 key pair
+        (server: once at startup, client: once per connection)
         Returns: (private_key, public_key)
         """
-        self.rsa_private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-            backend=default_backend()
+        self.x25519_private_key = x25519.X25519PrivateKey.generate()
+        self.x25519_public_key = self.x25519_private_key.public_key()
+        raw = self.x25519_public_key.public_bytes(
+            encoding=serialization.Encoding.Raw,
+            format=serialization.PublicFormat.Raw
         )
-        self.rsa_public_key = self.rsa_private_key.public_key()
-        return self.rsa_private_key, self.rsa_public_key
+        self._x25519_public_key_b64 = base64.b64encode(raw).decode('utf-8')
+        return self.x25519_private_key, self.x25519_public_key
 
-    def get_public_key_pem(self):
+    def get_x25519_public_key(self):
         """
-        Export public key to PEM format (for transmission to client)
-        Returns: Base64-encoded PEM string
+        Export X25519 public key for transmission
+        Returns: Base64-encoded 32-byte raw public key (cached by generate_x25519_keys)
         """
-        if not self.rsa_public_key:
-            raise ValueError("No public key available. Call generate_rsa_keys() first.")
-        
-        pem = self.rsa_public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
-            format=serialization.PublicFormat.SubjectPublicKeyInfo
-        )
-        return base64.b64encode(pem).decode('utf-8')
+        if not self._x25519_public_key_b64:
+            raise ValueError("No X25519 key available. Call generate_x25519_keys() first.")
+
+        return self._x25519_public_key_b64
 
-    def load_public_key_pem(self, pem_b64):
+    def derive_session_key(self, peer_public_key_b64):
         """
-        Load public key from base64-encoded PEM (Client side)
+        Derive the AES-256 session key from an ECDH exchange with the peer's
+        X25519 public key (both sides compute the same key)
+        Returns: 32-byte session key
         """
-        pem = base64.b64decode(pem_b64.encode('utf-8'))
-        self.rsa_public_key = serialization.load_pem_public_key(
-            pem,
-            backend=default_backend()
+        if not self.x25519_private_key:
+            raise ValueError("No X25519 private key available for key exchange")
+
+        # b64decode accepts the ASCII str as is
+        peer_public_key = x25519.X25519PublicKey.from_public_bytes(
+            base64.b64decode(peer_public_key_b64)
         )
+        shared_secret = self.x25519_private_key.exchange(peer_public_key)
+
+        session_key = HKDF(
+            algorithm=_HKDF_HASH,
+            length=32,
+            salt=None,
+            info=SESSION_KEY_INFO,
+            backend=default_backend()
+        ).derive(shared_secret)
+        self.set_session_key(session_key)
+        return session_key
 
     # ==================== SESSION KEY (AES) MANAGEMENT ====================
     
-    def generate_session_key(self):
-        """
-        Generate random AES-256 session key (Client side)
-        Returns: 32-byte session key
-        """
-        self.session_key = os.urandom(32)  # 256-bit AES key
-        return self.session_key
-
     def set_session_key(self, key):
         """
         Set the AES session key
@@ -76,123 +104,105 @@ class MessageEncryption:
         if len(key) != 32:
             raise ValueError("Session key must be 32 bytes for AES-256")
         self.session_key = key
-
-    def encrypt_session_key(self, session_key=None):
-        """
-        Encrypt session key using RSA public key (Client side)
-        """
-        if not self.rsa_public_key:
-            raise ValueError("No public key available for encryption")
-        
-        key_to_encrypt = session_key or self.session_key
-        if not key_to_encrypt:
-            raise ValueError("No session key to encrypt")
-
-        encrypted_key = self.rsa_public_key.encrypt(
-            key_to_encrypt,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        return base64.b64encode(encrypted_key).decode('utf-8')
-
-    def decrypt_session_key(self, encrypted_key_b64):
-        """
-        Decrypt session key using RSA private key (Server side)
-        """
-        if not self.rsa_private_key:
-            raise ValueError("No private key available for decryption")
-
-        encrypted_key = base64.b64decode(encrypted_key_b64.encode('utf-8'))
-        
-        decrypted_key = self.rsa_private_key.decrypt(
-            encrypted_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
-        self.session_key = decrypted_key
-        return decrypted_key
+        # Build the cipher once; it is reused for every message on this session
+        self._aead = AESGCM(key)
+        self._nonce_prefix = os.urandom(NONCE_PREFIX_SIZE)
+        self._nonce_counter = itertools.count()
 
     # ==================== MESSAGE ENCRYPTION (AES) ====================
     
     def encrypt_message(self, message):
         """
-        Encrypt message using AES-256-CBC
+        Encrypt a message (str or bytes) using AES-256-GCM
+        Returns: nonce + ciphertext + tag as raw bytes (frames are
+        length-prefixed, so no base64 is needed)
         """
-        if not self.session_key:
-            raise ValueError("No session key set. Complete key exchange first.")
-
         # Convert string to bytes if needed
         if isinstance(message, str):
             message = message.encode('utf-8')
 
-        # Generate random IV (Initialization Vector)
-        iv = os.urandom(16)  # AES block size is 16 bytes
-
-        # Pad message to AES block size (PKCS7 padding)
-        padded_message = self._pad(message)
-
-        # Create cipher and encrypt
-        cipher = Cipher(
-            algorithms.AES(self.session_key),
-            modes.CBC(iv),
-            backend=default_backend()
-        )
-        encryptor = cipher.encryptor()
-        ciphertext = encryptor.update(padded_message) + encryptor.finalize()
-
-        # Combine IV + ciphertext and encode to base64
-        encrypted_data = iv + ciphertext
-        return base64.b64encode(encrypted_data).decode('utf-8')
+        return self.encrypt_bytes(message)
 
     def decrypt_message(self, encrypted_message):
         """
-        Decrypt message using AES-256-CBC
+        Decrypt raw nonce + ciphertext + tag using AES-256-GCM
+        Returns: Plaintext bytes (parse_message accepts bytes directly)
+        """
+        return self.decrypt_bytes(encrypted_message)
+
+    def encrypt_bytes(self, data):
+        """
+        Encrypt raw bytes using AES-256-GCM
+        Returns: nonce + ciphertext + tag as raw bytes (no base64)
         """
-        if not self.session_key:
+        if not self._aead:
             raise ValueError("No session key set. Complete key exchange first.")
 
-        # Decode from base64
-        encrypted_data = base64.b64decode(encrypted_message.encode('utf-8'))
+        nonce = self._next_nonce()
+        return nonce + self._aead.encrypt(nonce, data, None)
 
-        # Extract IV and ciphertext
-        iv = encrypted_data[:16]
-        ciphertext = encrypted_data[16:]
+    def seal(self, data):
+        """
+        Encrypt raw bytes using AES-256-GCM without joining the result
+        Returns: (nonce, ciphertext + tag), to be sent back to back as one
+        frame body (saves copying the ciphertext just to prepend the nonce)
+        """
+        if not self._aead:
+            raise ValueError("No session key set. Complete key exchange first.")
 
-        # Create cipher and decrypt
-        cipher = Cipher(
-            algorithms.AES(self.session_key),
-            modes.CBC(iv),
-            backend=default_backend()
-        )
-        decryptor = cipher.decryptor()
-        padded_message = decryptor.update(ciphertext) + decryptor.finalize()
+        nonce = self._next_nonce()
+        return nonce, self._aead.encrypt(nonce, data, None)
 
-        # Remove padding and decode to string
-        message = self._unpad(padded_message)
-        return message.decode('utf-8')
+    def _next_nonce(self):
+        """Return the next unique nonce for this session key"""
+        counter = next(self._nonce_counter)
+        if counter > MAX_NONCE_COUNTER:
+            raise ValueError("Nonce space exhausted for this session key; reconnect to rekey")
+        return self._nonce_prefix + _pack_nonce_counter(counter)
 
-    # ==================== HELPER METHODS ====================
-    
-    def _pad(self, data):
+    def decrypt_bytes(self, encrypted_data):
         """
-        Apply PKCS7 padding
+        Decrypt raw nonce + ciphertext + tag bytes using AES-256-GCM
+        Raises: cryptography.exceptions.InvalidTag if the data was tampered with
         """
-        padding_length = 16 - (len(data) % 16)
-        padding = bytes([padding_length] * padding_length)
-        return data + padding
+        if not self._aead:
+            raise ValueError("No session key set. Complete key exchange first.")
+
+        return self._aead.decrypt(
+            bytes(encrypted_data[:NONCE_SIZE]), encrypted_data[NONCE_SIZE:], None
+        )
 
-    def _unpad(self, data):
+    def encrypt_stream(self, chunks):
         """
-        Remove PKCS7 padding
+        Encrypt a sequence of chunks (e.g. a file transfer) with AES-256-GCM
+        Yields: nonce + ciphertext + tag per chunk (same layout as encrypt_bytes).
+        With encrypt_into (cryptography >= 45) every chunk is sealed into one
+        reused buffer, so a yielded chunk is only valid until the next is requested.
         """
-        padding_length = data[-1]
-        return data[:-padding_length]
+        if not self._aead:
+            raise ValueError("No session key set. Complete key exchange first.")
+
+        next_nonce = self._next_nonce
+        if not hasattr(self._aead, 'encrypt_into'):
+            encrypt = self._aead.encrypt
+            for chunk in chunks:
+                nonce = next_nonce()
+                yield nonce + encrypt(nonce, chunk, None)
+            return
+
+        encrypt_into = self._aead.encrypt_into
+        buf = bytearray()
+        view = memoryview(buf)
+        for chunk in chunks:
+            size = NONCE_SIZE + len(chunk) + TAG_SIZE
+            if size > len(buf):
+                view.release()
+                buf = bytearray(size)
+                view = memoryview(buf)
+            nonce = next_nonce()
+            view[:NONCE_SIZE] = nonce
+            encrypt_into(nonce, chunk, None, view[NONCE_SIZE:size])
+            yield view[:size]
 
     # ==================== UTILITY METHODS ====================
     
@@ -206,9 +216,13 @@ class MessageEncryption:
     def reset(self):
         """Reset encryption state (for new connection)"""
         self.session_key = None
-        self.rsa_private_key = None
-        self.rsa_public_key = None
+        self._aead = None
+        self._nonce_prefix = None
+        self._nonce_counter = None
         self.peer_public_key = None
+        self.x25519_private_key = None
+        self.x25519_public_key = None
+        self._x25519_public_key_b64 = None
 
 
 
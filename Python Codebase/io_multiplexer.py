@@ -5,20 +5,88 @@ select(), poll() and epoll() implementations
 """
 import select
 import sys
+import threading
+import types
+
+
+# Process-wide multiplexers, one per method (see IOMultiplexer.get)
+_MUX_CACHE = {}
+_MUX_CACHE_LOCK = threading.Lock()
+
+# Static description of each method, built once (read-only views)
+_METHOD_INFO = {
+    'select': types.MappingProxyType({
+        'name': 'select()',
+        'complexity': 'O(n)',
+        'max_fds': '1024 (typical)',
+        'platforms': 'All (Windows, Linux, macOS)',
+        'best_for': 'Small number of connections'
+    }),
+    'poll': types.MappingProxyType({
+        'name': 'poll()',
+        'complexity': 'O(n)',
+        'max_fds': 'No limit',
+        'platforms': 'Unix/Linux (not Windows)',
+        'best_for': 'Moderate number of connections'
+    }),
+    'epoll': types.MappingProxyType({
+        'name': 'epoll()',
+        'complexity': 'O(1)',
+        'max_fds': 'No limit',
+        'platforms': 'Linux only',
+        'best_for': 'Large number of connections (10,000+)'
+    })
+}
+
+
+def best_method():
+    """Most scalable method on this platform: epoll (Linux) > poll (Unix) > select (all)"""
+    if hasattr(select, 'epoll'):
+        return 'epoll'
+    if hasattr(select, 'poll'):
+        return 'poll'
+    return 'select'
+
+
+def resolve_method(method):
+    """Map 'auto' (or None) to best_method(); other names are returned unchanged"""
+    if method in (None, 'auto'):
+        return best_method()
+    return method
 
 
 class IOMultiplexer:
     """Handles I/O multiplexing with different methods"""
     
-    def __init__(self, method='select'):
+    @classmethod
+    def get(cls, method='auto'):
+        """
+        Return the shared multiplexer for this method, creating it on first use.
+        Reconnects reuse the same epoll/poll object instead of opening a new one;
+        callers unregister() their sockets but never close the poller.
+        """
+        method = resolve_method(method)
+        with _MUX_CACHE_LOCK:
+            multiplexer = _MUX_CACHE.get(method)
+            if multiplexer is None:
+                multiplexer = _MUX_CACHE[method] = cls(method)
+            return multiplexer
+    
+    def __init__(self, method='auto', oneshot=False):
         """
         Initialize I/O multiplexer
         
         Args:
-            method: 'select', 'poll', or 'epoll'
+            method: 'auto', 'select', 'poll', or 'epoll'
+            oneshot: epoll only - register sockets edge-triggered and one-shot:
+                each socket is reported once, then stays disabled until rearm().
+                Meant for a reactor whose workers drain the socket; do not mix
+                with wait_for_read().
         """
+        method = resolve_method(method)
         self.method = method
         self.poller = None
+        self._registered = {}  # fd -> socket, for persistent registration
         
         # Setup based on method
         if method == 'poll' and hasattr(select, 'poll'):
@@ -30,7 +98,70 @@ class IOMultiplexer:
         else:
             self.method = 'select'
             print(f"[IO] Using select() for I/O multiplexing")
+        
+        self.oneshot = oneshot and self.method == 'epoll'
+        if self.oneshot:
+            self._epoll_mask = select.EPOLLIN | select.EPOLLET | select.EPOLLONESHOT
+        elif self.method == 'epoll':
+            self._epoll_mask = select.EPOLLIN
     
+    def register(self, socket_obj):
+        """
+        Register a socket for read events once.
+        The registration persists across poll() calls, so steady-state
+        waits need no epoll_ctl()/fd-array rebuild per message.
+        """
+        fd = socket_obj.fileno()
+        if self.method == 'epoll':
+            self.poller.register(fd, self._epoll_mask)
+        elif self.method == 'poll':
+            self.poller.register(fd, select.POLLIN)
+        self._registered[fd] = socket_obj
+
+    def rearm(self, socket_obj):
+        """
+        Re-enable a socket of a oneshot multiplexer once its data was handled.
+        A single epoll_ctl(MOD), safe from any thread; data that arrived in
+        the meantime is reported on the next poll().
+        """
+        self.poller.modify(socket_obj.fileno(), self._epoll_mask)
+
+    def unregister(self, socket_obj):
+        """Remove a socket registered with register()"""
+        fd = socket_obj.fileno()
+        if self._registered.get(fd) is not socket_obj:
+            # Already closed (fileno() is -1): find its old fd
+            fd = next((fd for fd, sock in self._registered.items() if sock is socket_obj), None)
+            if fd is None:
+                return
+        del self._registered[fd]
+        if self.method in ('epoll', 'poll'):
+            try:
+                self.poller.unregister(fd)
+            except (KeyError, OSError, ValueError):
+                pass  # Already closed (the kernel drops closed fds from epoll)
+
+    def poll(self, timeout=1):
+        """
+        Wait until registered sockets are readable
+
+        Args:
+            timeout: Timeout in seconds (None blocks until a socket is readable)
+
+        Returns:
+            List of readable file descriptors (empty on timeout)
+        """
+        try:
+            if self.method == 'epoll':
+                return [fd for fd, _ in self.poller.poll(timeout)]
+            elif self.method == 'poll':
+                return [fd for fd, _ in self.poller.poll(None if timeout is None else timeout * 1000)]
+            readable, _, _ = select.select(list(self._registered), [], [], timeout)
+            return readable
+        except Exception as e:
+            print(f"[IO ERROR] {self.method}() failed: {e}")
+            return []
+
     def wait_for_read(self, socket_obj, timeout=1):
         """
         Wait for socket to be readable
@@ -40,7 +171,8 @@ class IOMultiplexer:
             timeout: Timeout in seconds
             
         Returns:
-            True if socket is readable, False otherwise
+            True if socket is readable, False otherwise (poll/epoll may also
+            return False early when another registered socket is ready)
         """
         if self.method == 'select':
             return self._wait_select(socket_obj, timeout)
@@ -64,6 +196,24 @@ class IOMultiplexer:
             print(f"[IO ERROR] select() failed: {e}")
             return False
     
+    def _ensure_registered(self, socket_obj):
+        """
+        Register socket_obj with this instance's poller unless it already is
+        (a reused fd number belonging to a closed socket is re-registered)
+
+        Returns:
+            The socket's file descriptor
+        """
+        fd = socket_obj.fileno()
+        if self._registered.get(fd) is not socket_obj:
+            try:
+                self.register(socket_obj)
+            except FileExistsError:
+                # Stale epoll entry for this fd number: re-arm it for the new socket
+                self.poller.modify(fd, self._epoll_mask)
+                self._registered[fd] = socket_obj
+        return fd
+    
     def _wait_poll(self, socket_obj, timeout):
         """
         Use poll() for I/O multiplexing
@@ -73,23 +223,13 @@ class IOMultiplexer:
         - Better than select for many connections
         - Available on most Unix systems
 
+        The socket is registered once with the instance's poll object;
+        later waits are a single poll() call.
         """
         try:
-            if not hasattr(select, 'poll'):
-                print("[IO] poll() not available, falling back to select()")
-                return self._wait_select(socket_obj, timeout)
-            
-            # Register socket
-            poll_obj = select.poll()
-            poll_obj.register(socket_obj.fileno(), select.POLLIN)
-            
-            # Wait for events
-            events = poll_obj.poll(timeout * 1000)  # timeout in milliseconds
-            
-            # Unregister
-            poll_obj.unregister(socket_obj.fileno())
-            
-            return len(events) > 0
+            fd = self._ensure_registered(socket_obj)
+            events = self.poller.poll(timeout * 1000)  # timeout in milliseconds
+            return any(event_fd == fd for event_fd, _ in events)
             
         except Exception as e:
             print(f"[IO ERROR] poll() failed: {e}")
@@ -103,57 +243,32 @@ class IOMultiplexer:
         - O(1) complexity for operations
         - Very efficient for large numbers of connections
         - Best performance on Linux
+
+        The socket is registered once with the instance's epoll object (kept
+        in the kernel across calls); later waits are a single epoll_wait().
+        Level-triggered, so data left unread is reported again next time.
         """
         try:
-            if not hasattr(select, 'epoll'):
-                print("[IO] epoll() not available, falling back to select()")
-                return self._wait_select(socket_obj, timeout)
-            
-            # Create epoll object
-            epoll_obj = select.epoll()
-            
-            # Register socket for read events
-            epoll_obj.register(socket_obj.fileno(), select.EPOLLIN)
-            
-            # Wait for events
-            events = epoll_obj.poll(timeout)
-            
-            # Cleanup
-            epoll_obj.unregister(socket_obj.fileno())
-            epoll_obj.close()
-            
-            return len(events) > 0
+            fd = self._ensure_registered(socket_obj)
+            events = self.poller.poll(timeout)
+            return any(event_fd == fd for event_fd, _ in events)
             
         except Exception as e:
             print(f"[IO ERROR] epoll() failed: {e}")
             return False
     
+    def close(self):
+        """Close the epoll object (poll/select hold no kernel resources)"""
+        with _MUX_CACHE_LOCK:
+            if _MUX_CACHE.get(self.method) is self:
+                del _MUX_CACHE[self.method]
+        self._registered.clear()
+        if self.method == 'epoll':
+            self.poller.close()
+    
     def get_method_info(self):
-        """Get information about current I/O method"""
-        info = {
-            'select': {
-                'name': 'select()',
-                'complexity': 'O(n)',
-                'max_fds': '1024 (typical)',
-                'platforms': 'All (Windows, Linux, macOS)',
-                'best_for': 'Small number of connections'
-            },
-            'poll': {
-                'name': 'poll()',
-                'complexity': 'O(n)',
-                'max_fds': 'No limit',
-                'platforms': 'Unix/Linux (not Windows)',
-                'best_for': 'Moderate number of connections'
-            },
-            'epoll': {
-                'name': 'epoll()',
-                'complexity': 'O(1)',
-                'max_fds': 'No limit',
-                'platforms': 'Linux only',
-                'best_for': 'Large number of connections (10,000+)'
-            }
-        }
-        return info.get(self.method, info['select'])
+        """Get information about current I/O method (read-only mapping)"""
+        return _METHOD_INFO.get(self.method, _METHOD_INFO['select'])
 
 
 
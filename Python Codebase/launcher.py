@@ -4,10 +4,16 @@ ClassChat Launcher - All-in-One Control Panel
 import tkinter as tk
 from tkinter import ttk, messagebox
 import subprocess
+import multiprocessing
+import multiprocessing.process
+import socket
 import sys
 import os
 import threading
 import time
+import config
+
+SERVER_START_TIMEOUT = 5.0  # Seconds to wait for the server's readiness signal
 
 
 class ClassChatLauncher:
@@ -25,6 +31,15 @@ class ClassChatLauncher:
         self.client_count = 0
         self.server_running = False
 
+        # On Linux clients are forked from a forkserver that has already imported
+        # the client module (tkinter, cryptography, ...), so a new window skips
+        # interpreter startup and shares those pages. Windows cannot fork, and
+        # macOS cannot safely fork once Tk/Cocoa is loaded: both use Popen.
+        self.client_context = None
+        if sys.platform.startswith('linux'):
+            self.client_context = multiprocessing.get_context('forkserver')
+            self.client_context.set_forkserver_preload(['client'])
+
         self.create_gui()
 
     def create_gui(self):
@@ -206,56 +221,102 @@ class ClassChatLauncher:
             messagebox.showinfo("Server", "Server is already running!")
             return
 
+        ready_socket = None
         try:
             # Start server WITH visible console window
             server_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
 
             print(f"[LAUNCHER] Starting server: {server_script}")
 
+            # The server connects here once it listens, so readiness is known
+            # without probing the chat port (a probe would be a client session)
+            ready_socket = socket.create_server(('127.0.0.1', 0))
+            ready_socket.setblocking(False)
+            env = dict(os.environ)
+            env[config.READY_PORT_ENV] = str(ready_socket.getsockname()[1])
+
             if sys.platform == 'win32':
                 # Windows - SHOW console window for server (so you can see debug output)
                 self.server_process = subprocess.Popen(
                     [sys.executable, server_script],
-                    creationflags=subprocess.CREATE_NEW_CONSOLE
+                    creationflags=subprocess.CREATE_NEW_CONSOLE,
+                    env=env
                 )
             else:
                 # Linux/Mac - run in terminal
                 self.server_process = subprocess.Popen(
-                    [sys.executable, server_script]
+                    [sys.executable, server_script],
+                    env=env
                 )
 
-            # Give server time to start
-            time.sleep(1)
+            self.server_btn.config(text="⏳  STARTING SERVER...", state=tk.DISABLED)
+            # Wait for the signal without blocking the Tk main loop
+            self.wait_for_server(self.server_process, ready_socket,
+                                 time.monotonic() + SERVER_START_TIMEOUT)
+
+        except Exception as e:
+            if ready_socket is not None:
+                ready_socket.close()
+            self.server_failed(e)
+
+    def wait_for_server(self, process, ready_socket, deadline):
+        """
+        Check (from the Tk event loop, every 50 ms) whether the server has
+        signalled readiness, exited, or run out of time
+        """
+        try:
+            ready_socket.accept()[0].close()
+        except BlockingIOError:
+            if process.poll() is not None:
+                ready_socket.close()
+                self.server_failed(RuntimeError(f"server exited with code {process.returncode}"))
+            elif time.monotonic() >= deadline:
+                ready_socket.close()
+                process.terminate()
+                self.server_failed(RuntimeError(f"server did not start within {SERVER_START_TIMEOUT:.0f} s"))
+            else:
+                self.root.after(50, self.wait_for_server, process, ready_socket, deadline)
+            return
+        except OSError as e:
+            ready_socket.close()
+            self.server_failed(e)
+            return
+        ready_socket.close()
+        self.server_started()
 
-            self.server_running = True
+    def server_started(self):
+        """Server signalled readiness: update the UI"""
+        self.server_running = True
 
-            # Update UI
-            self.server_btn.config(
-                text="✅  SERVER RUNNING",
-                bg='#27ae60',
-                state=tk.DISABLED
-            )
-            self.server_status_label.config(
-                text="Status: Running on 127.0.0.1:5555",
-                fg='#27ae60'
-            )
+        # Update UI
+        self.server_btn.config(
+            text="✅  SERVER RUNNING",
+            bg='#27ae60',
+            state=tk.DISABLED
+        )
+        self.server_status_label.config(
+            text="Status: Running on 127.0.0.1:5555",
+            fg='#27ae60'
+        )
 
-            # Enable client button
-            self.client_btn.config(state=tk.NORMAL, bg='#3498db')
+        # Enable client button
+        self.client_btn.config(state=tk.NORMAL, bg='#3498db')
 
-            # Show success message
-            messagebox.showinfo(
-                "Server Started",
-                "✅ Server started successfully!\n\n"
-                "Server console window opened.\n"
-                "You can now start clients."
-            )
+        # Show success message
+        messagebox.showinfo(
+            "Server Started",
+            "✅ Server started successfully!\n\n"
+            "Server console window opened.\n"
+            "You can now start clients."
+        )
 
-            print("[LAUNCHER] ✅ Server started successfully")
+        print("[LAUNCHER] ✅ Server started successfully")
 
-        except Exception as e:
-            print(f"[LAUNCHER] ❌ Failed to start server: {e}")
-            messagebox.showerror("Error", f"Failed to start server:\n{e}")
+    def server_failed(self, error):
+        """Server could not be started: report it and allow another try"""
+        print(f"[LAUNCHER] ❌ Failed to start server: {error}")
+        self.server_btn.config(text="🖥️  START SERVER", state=tk.NORMAL)
+        messagebox.showerror("Error", f"Failed to start server:\n{error}")
 
     def start_client(self):
         """Start a new client"""
@@ -274,12 +335,18 @@ class ClassChatLauncher:
 
             print(f"[LAUNCHER] Starting client #{self.client_count}: {client_script}")
 
-            if sys.platform == 'win32':
-                # Windows - just run normally (GUI will show)
+            if self.client_context is None:
+                # Windows/Mac - just run normally (GUI will show)
                 process = subprocess.Popen([sys.executable, client_script])
             else:
-                # Linux/Mac
-                process = subprocess.Popen([sys.executable, client_script])
+                # Linux - fork from the preloaded forkserver (the client module is
+                # imported there, never in the launcher itself)
+                process = self.client_context.Process(target=run_client)
+                process.start()
+                # Like a Popen client, the window outlives the launcher: drop it from
+                # multiprocessing's child tracking, whose atexit hook would otherwise
+                # keep the launcher waiting until every client window is closed
+                multiprocessing.process._children.discard(process)
 
             self.client_processes.append(process)
 
@@ -345,7 +412,7 @@ class ClassChatLauncher:
         # Stop all clients
         for i, process in enumerate(self.client_processes, 1):
             try:
-                process.terminate()
+                stop_process(process)
                 print(f"[LAUNCHER] Stopped client #{i}")
             except Exception as e:
                 print(f"[LAUNCHER] Error stopping client #{i}: {e}")
@@ -409,6 +476,27 @@ class ClassChatLauncher:
 
 
 
+def run_client():
+    """Entry point of a forked client process (the forkserver has preloaded client)"""
+    import client
+    client.main()
+
+
+def stop_process(process, timeout=2.0):
+    """
+    Terminate and reap a client started either way: subprocess.Popen
+    (Windows/Mac) or multiprocessing.Process (Linux forkserver)
+    """
+    if isinstance(process, subprocess.Popen):
+        if process.poll() is None:
+            process.terminate()
+            process.wait(timeout)
+    else:
+        if process.is_alive():
+            process.terminate()
+        process.join(timeout)
+
+
 def main():
     """Main function"""
     launcher = ClassChatLauncher()
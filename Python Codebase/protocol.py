@@ -1,13 +1,93 @@
 """
-Protocol module for handling JSON message formatting
+Protocol module for handling message formatting (JSON and packed binary) and socket framing
 """
 import json
+import socket
+import struct
+import sys
+import time
 import config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON codec: orjson (C, returns bytes) when available, stdlib json otherwise
+if orjson is not None:
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+else:
+    # One preconfigured encoder: same compact, UTF-8 output as orjson, and
+    # json.dumps() would build a new encoder per call for non-default options
+    _encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+    def _dumps(obj):
+        return _encode(obj).encode('utf-8')
+    _loads = json.loads
+
+
+def _json_string_body(text):
+    """JSON-escaped UTF-8 contents of a string, without the surrounding quotes"""
+    return _dumps(str(text))[1:-1]
+
+
+# Server messages sent on every connect, serialized once at import; only the
+# username (and the welcome's 'data') are substituted per connection.
+# Same key order and compact layout as create_message().
+_WELCOME_TEMPLATE = (
+    b'{"type":"%s","sender":"SERVER","receiver":null,'
+    b'"text":"Welcome to ClassChat, %%s!","data":%%s}' % config.MSG_SUCCESS.encode()
+)
+_USERNAME_TAKEN_TEMPLATE = (
+    b'{"type":"%s","sender":"SERVER","receiver":null,'
+    b'"text":"Username \'%%s\' is already taken","data":null}' % config.MSG_ERROR.encode()
+)
+# Server message whose 'data' is already serialized (type, receiver, data)
+_SERVER_MESSAGE_TEMPLATE = b'{"type":"%s","sender":"SERVER","receiver":%s,"text":null,"data":%s}'
+
+
+# Wire framing: 4-byte big-endian length, then the frame body.
+# The body is a JSON header, optionally followed by b'\n' and a raw binary
+# payload (file contents). JSON headers never contain a raw newline.
+FRAME_HEADER = struct.Struct('>I')
+FRAME_HEADER_SIZE = FRAME_HEADER.size
+PAYLOAD_SEPARATOR = b'\n'
+
+# Bound methods of the precompiled Structs (no attribute lookup per frame)
+_pack_length = FRAME_HEADER.pack
+_unpack_length = FRAME_HEADER.unpack
+_unpack_length_from = FRAME_HEADER.unpack_from
+
+# Packed binary format for the hot message types (private/group chat):
+# 1-byte type tag, sender/receiver/text byte lengths, then the UTF-8 fields.
+# JSON always starts with b'{', so the first byte tells the two formats apart.
+PACKED_HEADER = struct.Struct('<BHHI')
+PACKED_PRIVATE = 0x01
+PACKED_GROUP = 0x02
+_pack_packed_header = PACKED_HEADER.pack
+_unpack_packed_header_from = PACKED_HEADER.unpack_from
+PACKED_TYPES = {
+    PACKED_PRIVATE: config.MSG_PRIVATE,
+    PACKED_GROUP: config.MSG_GROUP
+}
+
 
 class Message:
     """Message class for creating and parsing messages"""
     
+    @staticmethod
+    def _envelope(msg_type, sender, receiver=None, text=None, data=None):
+        """Build the message dictionary shared by all message types"""
+        return {
+            "type": msg_type,
+            "sender": sender,
+            "receiver": receiver,
+            "text": text,
+            "data": data
+        }
+    
     @staticmethod
     def create_message(msg_type, sender, receiver=None, text=None, data=None):
         """
@@ -21,42 +101,59 @@ class Message:
             data: Additional data (optional)
         
         Returns:
-            JSON string
+            UTF-8 encoded JSON bytes (ready to encrypt or frame, no str round-trip)
         """
-        message = {
+        # Dict literal built inline (no helper call on the per-message path)
+        return _dumps({
             "type": msg_type,
             "sender": sender,
             "receiver": receiver,
             "text": text,
             "data": data
-        }
-        return json.dumps(message)
+        })
+    
+    @staticmethod
+    def serialize(message):
+        """
+        Serialize an already-built message dictionary (e.g. when relaying)
+        
+        Returns:
+            UTF-8 encoded JSON bytes
+        """
+        return _dumps(message)
     
     @staticmethod
     def parse_message(json_str):
         """
-        Parse JSON message string
+        Parse JSON message string or packed binary message
         
         Args:
-            json_str: JSON formatted string
+            json_str: JSON formatted string, UTF-8 bytes or packed message bytes
         
         Returns:
-            Dictionary with message data
+            Dictionary with message data, or None if malformed
         """
-        try:
-            message = json.loads(json_str)
+        # Packed private/group messages are dispatched on the first byte
+        if not isinstance(json_str, str) and json_str and json_str[0] in PACKED_TYPES:
+            return Message.unpack(json_str)
 
-            # DEBUG: Print the parsed message
-            print("\n" + "=" * 60)
-            print(f"📥 PARSING JSON MESSAGE (Type: {message.get('type')})")
-            print("=" * 60)
-            print(json.dumps(message, indent=2))
-            print("=" * 60 + "\n")
+        try:
+            message = _loads(json_str)
+            # Shape check, as a typed decoder would do: handlers rely on a JSON
+            # object with a string 'type' and an object (or null) 'data'
+            if type(message) is not dict or type(message.get('type')) is not str:
+                return None
+            data = message.get('data')
+            if data is not None and type(data) is not dict:
+                return None
 
+            # DEBUG: one line per parsed message (stripped entirely under python -O)
+            if __debug__ and config.DEBUG_PROTOCOL:
+                sys.stderr.write(f"[MSG] {message.get('type')}\n")
 
-            return json.loads(json_str)
+            return message
 
-        except json.JSONDecodeError:
+        except (ValueError, TypeError):
             return None
     
     @staticmethod
@@ -69,24 +166,104 @@ class Message:
         """Create disconnection message"""
         return Message.create_message(config.MSG_DISCONNECT, username)
     
+    @staticmethod
+    def pack_private(sender, receiver, text):
+        """
+        Pack private message into the binary format
+        
+        Returns:
+            Packed message bytes
+        """
+        return Message._pack(PACKED_PRIVATE, sender, receiver, text)
+    
+    @staticmethod
+    def pack_group(sender, group_name, text):
+        """
+        Pack group message into the binary format
+        
+        Returns:
+            Packed message bytes
+        """
+        return Message._pack(PACKED_GROUP, sender, group_name, text)
+    
+    @staticmethod
+    def _pack(tag, sender, receiver, text):
+        """Pack header and UTF-8 fields for a private/group message"""
+        sender = sender.encode('utf-8')
+        receiver = receiver.encode('utf-8')
+        text = text.encode('utf-8')
+        # Single join allocates the result once instead of one copy per '+'
+        return b''.join((
+            _pack_packed_header(tag, len(sender), len(receiver), len(text)),
+            sender, receiver, text
+        ))
+    
+    @staticmethod
+    def unpack(data):
+        """
+        Unpack a binary private/group message
+        
+        Args:
+            data: Packed message bytes
+        
+        Returns:
+            Dictionary with message data (same keys as JSON messages), or None if malformed
+        """
+        try:
+            tag, sender_len, receiver_len, text_len = _unpack_packed_header_from(data)
+        except struct.error:
+            return None
+        
+        start = PACKED_HEADER.size
+        receiver_start = start + sender_len
+        text_start = receiver_start + receiver_len
+        if tag not in PACKED_TYPES or text_start + text_len != len(data):
+            return None
+        
+        # Decode straight from memoryview slices (no intermediate bytes copies)
+        view = memoryview(data)
+        try:
+            return {
+                "type": PACKED_TYPES[tag],
+                "sender": str(view[start:receiver_start], 'utf-8'),
+                "receiver": str(view[receiver_start:text_start], 'utf-8'),
+                "text": str(view[text_start:], 'utf-8'),
+                "data": None
+            }
+        except UnicodeDecodeError:
+            return None
+    
     @staticmethod
     def create_private_message(sender, receiver, text):
-        """Create private message"""
-        return Message.create_message(config.MSG_PRIVATE, sender, receiver, text)
+        """Create private message (packed binary, see pack_private)"""
+        return Message._pack(PACKED_PRIVATE, sender, receiver, text)
     
     @staticmethod
     def create_group_message(sender, group_name, text):
-        """Create group message"""
-        return Message.create_message(config.MSG_GROUP, sender, group_name, text)
+        """Create group message (packed binary, see pack_group)"""
+        return Message._pack(PACKED_GROUP, sender, group_name, text)
     
     @staticmethod
-    def create_file_message(sender, receiver, filename, file_data):
-        """Create file transfer message"""
+    def create_file_message(sender, receiver, filename, filesize, is_group=False, chunks=0):
+        """
+        Create file transfer header.
+        The file contents follow as `chunks` FILE_CHUNK frames, each carrying
+        up to config.CHUNK_SIZE raw bytes as its binary payload.
+        """
         data = {
             "filename": filename,
-            "filedata": file_data
+            "filesize": filesize,
+            "chunks": chunks
         }
-        return Message.create_message(config.MSG_FILE, sender, receiver, None, data)
+        message = Message._envelope(config.MSG_FILE, sender, receiver, None, data)
+        if is_group:
+            message["is_group"] = True
+        return _dumps(message)
+    
+    @staticmethod
+    def create_file_chunk_message(sender, receiver):
+        """Create header for one file chunk (the chunk bytes are the frame payload)"""
+        return Message.create_message(config.MSG_FILE_CHUNK, sender, receiver)
     
     @staticmethod
     def create_error_message(text):
@@ -94,6 +271,440 @@ class Message:
         return Message.create_message(config.MSG_ERROR, "SERVER", None, text)
     
     @staticmethod
-    def create_success_message(text):
-        """Create success message"""
-        return Message.create_message(config.MSG_SUCCESS, "SERVER", None, text)
+    def create_success_message(text, data=None):
+        """Create success message (data: optional extra fields, e.g. the server public key)"""
+        return Message.create_message(config.MSG_SUCCESS, "SERVER", None, text, data)
+    
+    @staticmethod
+    def create_welcome_message(username, data_json=b'null'):
+        """
+        Create the welcome (success) message for a newly connected user
+        
+        Args:
+            username: Connected user
+            data_json: Pre-serialized 'data' object, e.g. from serialize()
+        
+        Returns:
+            UTF-8 encoded JSON bytes
+        """
+        return _WELCOME_TEMPLATE % (_json_string_body(username), data_json)
+    
+    @staticmethod
+    def create_server_message(msg_type, receiver, data_json):
+        """
+        Create a SERVER message around an already serialized 'data' object,
+        so data shared by many responses is serialized once, not per response
+        
+        Args:
+            msg_type: Type of message (from config)
+            receiver: Receiver username (or None)
+            data_json: Serialized 'data' object, e.g. from serialize()
+        
+        Returns:
+            UTF-8 encoded JSON bytes (same layout as create_message())
+        """
+        return _SERVER_MESSAGE_TEMPLATE % (_json_string_body(msg_type), _dumps(receiver), data_json)
+    
+    @staticmethod
+    def create_username_taken_message(username):
+        """Create the error message for a username that is already connected"""
+        return _USERNAME_TAKEN_TEMPLATE % _json_string_body(username)
+
+
+def configure_socket(sock):
+    """
+    Apply socket tuning from config: client sockets before connect() (so the
+    receive buffer size is used for TCP window scaling), server sockets on
+    the listener (inherited by accepted sockets) and again after accept()
+    where accepted sockets do not inherit them (see ACCEPT_INHERITS_OPTIONS)
+    """
+    if config.TCP_NODELAY:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Setting a buffer size disables Linux autotuning, so only do it on request
+    if config.TCP_RCVBUF_OVERRIDE:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, config.TCP_RCVBUF_OVERRIDE)
+    if config.TCP_SNDBUF_OVERRIDE:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, config.TCP_SNDBUF_OVERRIDE)
+
+
+def set_send_timeout(sock, seconds):
+    """
+    Make blocking sends on sock fail (EAGAIN) after waiting `seconds` for
+    buffer space. Set as a socket option, so reads and sends keep their
+    plain blocking fast path (settimeout() would poll before every call).
+    """
+    if sys.platform == 'win32':
+        value = struct.pack('I', int(seconds * 1000))  # DWORD milliseconds
+    else:
+        value = struct.pack('ll', int(seconds), int(seconds % 1 * 1000000))  # struct timeval
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, value)
+
+
+# Linux copies the listener's options (TCP_NODELAY, buffer sizes) to accepted
+# sockets, so the server can skip re-applying them on every accept()
+ACCEPT_INHERITS_OPTIONS = sys.platform.startswith('linux')
+
+# Per-call non-blocking recv (unavailable on Windows)
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+# Scatter-gather sends (sendmsg) are unavailable on Windows
+HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')
+# sendmsg() accepts at most IOV_MAX buffers per call (1024 on Linux)
+MAX_SEND_BUFFERS = 1024
+# Per-call TCP_CORK (Linux): hold a short write back until the data after it is queued
+MSG_MORE = getattr(socket, 'MSG_MORE', 0)
+
+
+def send_buffers(sock, buffers, flags=0, timeout=None):
+    """
+    Send several buffers as one contiguous stream without concatenating them.
+    Uses sendmsg() so the kernel gathers all buffers in a single syscall,
+    resuming after partial writes; falls back to one joined sendall().
+
+    Args:
+        sock: Connected (blocking) socket
+        buffers: List of bytes-like objects
+        flags: sendmsg() flags (e.g. MSG_MORE)
+        timeout: Seconds the whole write may take, for a socket whose
+            SO_SNDTIMEO (set_send_timeout) is the same value. SO_SNDTIMEO
+            bounds each call only, so each resumed call after a partial
+            write gets just the time left, and a peer that keeps reading a
+            few bytes at a time cannot stretch the write past the deadline.
+            Not enforced by the sendall() fallback.
+
+    Raises:
+        TimeoutError: if the deadline passes before everything is sent
+    """
+    if not HAS_SENDMSG:
+        sock.sendall(b''.join(buffers))
+        return
+
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+    # Common case: the kernel takes everything in one call, no views needed
+    sent = sock.sendmsg(buffers, (), flags)
+    remaining = sum(map(len, buffers)) - sent
+    if remaining <= 0:
+        return
+
+    views = [memoryview(buf) for buf in buffers]
+    index = 0
+    try:
+        while True:
+            # Skip fully sent buffers and trim the partially sent one
+            while sent >= views[index].nbytes:
+                sent -= views[index].nbytes
+                index += 1
+            views[index] = views[index][sent:]
+            if timeout is not None:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    raise TimeoutError(f"send did not complete within {timeout} s")
+                set_send_timeout(sock, max(left, 0.001))  # 0 would mean no timeout
+            sent = sock.sendmsg(views[index:], (), flags)
+            remaining -= sent
+            if remaining <= 0:
+                return
+    finally:
+        if timeout is not None:
+            set_send_timeout(sock, timeout)
+
+
+def send_frame(sock, header, payload=None, timeout=None):
+    """
+    Send one length-prefixed frame
+
+    Args:
+        sock: Connected socket
+        header: Header bytes (JSON or encrypted JSON)
+        payload: Raw binary payload (optional)
+        timeout: Deadline for the whole frame in seconds (see send_buffers)
+    """
+    if payload is None:
+        send_buffers(sock, [_pack_length(len(header)), header], timeout=timeout)
+    else:
+        send_buffers(sock, [_pack_length(len(header) + 1 + len(payload)), header, PAYLOAD_SEPARATOR, payload],
+                     timeout=timeout)
+
+
+def send_frames(sock, bodies, timeout=None):
+    """
+    Send several length-prefixed frames in one gathered write (one sendmsg()
+    per MAX_SEND_BUFFERS / 2 frames), so a burst of small messages leaves in
+    full TCP segments instead of one segment per message
+
+    Args:
+        sock: Connected socket
+        bodies: Iterable of frame bodies (bytes-like)
+        timeout: Deadline for each gathered write in seconds (see send_buffers)
+    """
+    buffers = []
+    for body in bodies:
+        buffers.append(_pack_length(len(body)))
+        buffers.append(body)
+        if len(buffers) == MAX_SEND_BUFFERS:
+            send_buffers(sock, buffers, timeout=timeout)
+            buffers = []
+    if buffers:
+        send_buffers(sock, buffers, timeout=timeout)
+
+
+def send_sealed_frame(sock, nonce, ciphertext, timeout=None):
+    """
+    Send one encrypted frame whose body is nonce + ciphertext, gathering
+    the two parts in the kernel instead of concatenating them first
+
+    Args:
+        sock: Connected socket
+        nonce, ciphertext: The pair returned by MessageEncryption.seal()
+        timeout: Deadline for the whole frame in seconds (see send_buffers)
+    """
+    send_buffers(sock, [_pack_length(len(nonce) + len(ciphertext)), nonce, ciphertext], timeout=timeout)
+
+
+def send_sealed_frames(sock, sealed, timeout=None):
+    """
+    Send several encrypted frames in one gathered write, like send_frames()
+
+    Args:
+        sock: Connected socket
+        sealed: Iterable of (nonce, ciphertext) pairs from MessageEncryption.seal()
+        timeout: Deadline for each gathered write in seconds (see send_buffers)
+    """
+    buffers = []
+    for nonce, ciphertext in sealed:
+        buffers.append(_pack_length(len(nonce) + len(ciphertext)))
+        buffers.append(nonce)
+        buffers.append(ciphertext)
+        if len(buffers) > MAX_SEND_BUFFERS - 3:
+            send_buffers(sock, buffers, timeout=timeout)
+            buffers = []
+    if buffers:
+        send_buffers(sock, buffers, timeout=timeout)
+
+
+def frame_body(header, payload=None):
+    """
+    Build a frame body in memory (used when the whole body is encrypted)
+
+    Args:
+        header: Header bytes (JSON or packed)
+        payload: Raw binary payload (optional)
+
+    Returns:
+        bytes laid out exactly as split_frame() expects
+    """
+    if payload is None:
+        return header
+    return b''.join((header, PAYLOAD_SEPARATOR, payload))
+
+
+def iter_file_bodies(file_obj, header, chunk_size):
+    """
+    Yield one frame body (header + separator + file chunk) per chunk
+
+    A single buffer is reused: each yielded memoryview is only valid until
+    the next one is requested (encrypt or send it before moving on).
+    """
+    prefix = len(header) + 1
+    buf = bytearray(prefix + chunk_size)
+    buf[:prefix] = header + PAYLOAD_SEPARATOR
+    view = memoryview(buf)
+    while True:
+        n = file_obj.readinto(view[prefix:])
+        if not n:
+            return
+        yield view[:prefix + n]
+
+
+def send_file_frame(sock, header, file_obj, size, offset=0):
+    """
+    Send a frame whose payload is streamed straight from an open file
+    (size bytes starting at offset).
+    Uses socket.sendfile() (zero-copy sendfile(2) on Linux). The header is
+    sent with MSG_MORE so it leaves in the same segment as the first file
+    bytes instead of on its own (TCP_NODELAY would push it out at once).
+
+    Raises:
+        ConnectionError: if the file ended before size bytes were sent. The
+            length prefix already promised them, so the socket is shut down
+            rather than left out of sync with the peer's framing.
+    """
+    send_buffers(sock, [_pack_length(len(header) + 1 + size), header, PAYLOAD_SEPARATOR], MSG_MORE)
+    try:
+        sent = sock.sendfile(file_obj, offset, size)
+    except OSError:
+        _shutdown_quietly(sock)
+        raise
+    if sent != size:
+        _shutdown_quietly(sock)
+        raise ConnectionError(f"file ended after {sent} of {size} bytes; connection closed")
+
+
+def _shutdown_quietly(sock):
+    """Shut a socket down whose stream can no longer be framed correctly"""
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class FrameReader:
+    """
+    Buffered reader for length-prefixed frames.
+    A single recv_into() fills a reusable buffer and every complete frame
+    it contains is returned, so a burst of messages costs one syscall.
+    """
+
+    def __init__(self, sock, size=config.BUFFER_SIZE):
+        """
+        Args:
+            sock: Connected socket to read from
+            size: Initial buffer size (grows for large frames)
+        """
+        self.sock = sock
+        self._size = size
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0  # First unread byte
+        self._end = 0  # End of received data
+        self._needed = 0  # Total size of the frame currently being received
+
+    def fill(self, flags=0):
+        """
+        Read available data from the socket into the buffer
+
+        Args:
+            flags: recv() flags (e.g. MSG_DONTWAIT for a non-blocking attempt,
+                which raises BlockingIOError when no data is available)
+
+        Returns:
+            Number of bytes received (0 if the connection was closed)
+        """
+        self._compact()  # Deferred by frames(views=True)
+        if self._end == len(self._buf) or self._needed > len(self._buf) - self._start:
+            self._make_room()
+        received = self.sock.recv_into(self._view[self._end:], 0, flags)
+        self._end += received
+        return received
+
+    def has_partial_frame(self):
+        """True if part of a frame is buffered (the rest is likely in flight)"""
+        return self._end > self._start
+
+    def frames(self, views=False):
+        """
+        Extract all complete frames from the buffer
+
+        Args:
+            views: Return memoryviews into the buffer instead of bytes copies
+                (for consumers that only read the frame, e.g. decrypt it).
+                They are valid until the next fill() and must not be kept.
+
+        Returns:
+            List of frame bodies (bytes or memoryview)
+        """
+        next_frame = self._next_view if views else self._next_frame
+        frames = []
+        frame = next_frame()
+        while frame is not None:
+            frames.append(frame)
+            frame = next_frame()
+        if not views:
+            self._compact()
+        return frames
+
+    def read_frame(self):
+        """
+        Block until one complete frame is available.
+        Used for the handshake: frames that arrive in the same recv stay
+        buffered and are returned by later read_frame()/frames() calls.
+
+        Returns:
+            Frame body (bytes), or None if the connection was closed
+        """
+        frame = self._next_frame()
+        while frame is None:
+            if not self.fill():
+                return None
+            frame = self._next_frame()
+        self._compact()
+        return frame
+
+    def next_frame(self):
+        """
+        Return the next complete frame already in the buffer, without reading.
+        Used by the server's non-blocking handshake.
+
+        Returns:
+            Frame body (bytes), or None if no complete frame is buffered
+        """
+        frame = self._next_frame()
+        self._compact()
+        return frame
+
+    def _next_frame(self):
+        """Return the next complete frame from the buffer as bytes, or None"""
+        frame = self._next_view()
+        return None if frame is None else bytes(frame)
+
+    def _next_view(self):
+        """Return a view of the next complete frame in the buffer, or None"""
+        available = self._end - self._start
+        if available < FRAME_HEADER_SIZE:
+            return None
+        (length,) = _unpack_length_from(self._buf, self._start)
+        if length > config.MAX_FRAME_SIZE:
+            raise ValueError(f"Frame of {length} bytes exceeds MAX_FRAME_SIZE")
+        total = FRAME_HEADER_SIZE + length
+        if available < total:
+            self._needed = total
+            return None
+        body_start = self._start + FRAME_HEADER_SIZE
+        frame = self._view[body_start:body_start + length]
+        self._start += total
+        self._needed = 0
+        return frame
+
+    def _compact(self):
+        """Rewind the buffer once everything received has been consumed"""
+        if self._start == self._end:
+            self._start = self._end = 0
+            if len(self._buf) > self._size:
+                # Release the memory used by a large (file) frame
+                self._resize(self._size)
+
+    def _make_room(self):
+        """Move unread data to the front and grow the buffer if needed"""
+        pending = self._end - self._start
+        if self._start:
+            self._buf[:pending] = self._view[self._start:self._end]
+            self._start, self._end = 0, pending
+        needed = max(self._needed, pending + 1)
+        if needed > len(self._buf):
+            self._resize(max(needed, 2 * len(self._buf)))
+
+    def _resize(self, size):
+        """Resize the buffer (the memoryview must be released first)"""
+        self._view.release()
+        if size > len(self._buf):
+            self._buf.extend(bytes(size - len(self._buf)))
+        else:
+            del self._buf[size:]
+        self._view = memoryview(self._buf)
+
+
+def split_frame(body):
+    """
+    Split a frame body into its header and binary payload
+
+    Returns:
+        (header, payload) where payload is a memoryview or None
+    """
+    # Packed messages never carry a payload and may contain b'\n' anywhere
+    if body and body[0] in PACKED_TYPES:
+        return body, None
+    index = body.find(PAYLOAD_SEPARATOR)
+    if index < 0:
+        return body, None
+    return body[:index], memoryview(body)[index + 1:]
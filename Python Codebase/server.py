@@ -1,21 +1,86 @@
 """
 ClassChat Server - WITH ENCRYPTION
-Multi-threaded server with message history, conversation threading and RSA+AES encryption
+Reactor-based server with message history, conversation threading and X25519+AES encryption:
+one thread waits on every client socket, a small worker pool handles the ready ones
 """
+import os
 import socket
+import sys
 import threading
-import json
+import collections
+import concurrent.futures
+import logging
+import logging.handlers
+import queue
 from datetime import datetime
 import config
-from protocol import Message
-from database import MessageDatabase
+from protocol import (Message, FrameReader, configure_socket, send_frame, send_frames, send_sealed_frame,
+                      send_sealed_frames, split_frame, frame_body, set_send_timeout, MSG_DONTWAIT,
+                      ACCEPT_INHERITS_OPTIONS)
+from database import MessageDatabase, MessageWriter
 from encryption import MessageEncryption
+from io_multiplexer import IOMultiplexer
 import traceback
 import time
+import functools
+
+
+# Runtime logging: while a server runs, handler threads only queue a record and
+# one listener thread does the stdout writes. Before start() and after shutdown()
+# records are written directly, so scripts using these modules still see them.
+# Startup/shutdown lines print directly.
+_log_queue = queue.SimpleQueue()
+_log_stream = logging.StreamHandler(sys.stdout)
+_log_queue_handler = logging.handlers.QueueHandler(_log_queue)
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_stream)
+_log_root = logging.getLogger("classchat")
+_log_root.setLevel(config.LOG_LEVEL)
+_log_root.propagate = False
+_log_root.addHandler(_log_stream)
+log = logging.getLogger("classchat.server")
+
+
+def _start_queued_logging():
+    """Route classchat records through the queue to the listener thread"""
+    _log_listener.start()
+    _log_root.addHandler(_log_queue_handler)
+    _log_root.removeHandler(_log_stream)
+
+
+def _stop_queued_logging():
+    """Go back to direct writes, then write out whatever is still queued"""
+    if _log_queue_handler not in _log_root.handlers:
+        return
+    _log_root.addHandler(_log_stream)
+    _log_root.removeHandler(_log_queue_handler)
+    _log_listener.stop()
+
+
+@functools.lru_cache(maxsize=1024)
+def delivery_receipt(receiver):
+    """Serialized 'delivered' confirmation; identical for every message to receiver"""
+    return Message.create_success_message(f"Message delivered to {receiver}")
+
+
+@functools.lru_cache(maxsize=1024)
+def offline_notice(sender, receiver):
+    """Serialized 'receiver is offline' notice; identical for every message sender sends them"""
+    return Message.create_message(
+        config.MSG_OFFLINE,
+        "SERVER",
+        sender,
+        f"📬 '{receiver}' is offline. Message will be delivered when they connect."
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def unknown_user_error(receiver):
+    """Serialized error for a message to a user that does not exist"""
+    return Message.create_error_message(f"❌ User '{receiver}' does not exist. Cannot send message.")
 
 
 class ClassChatServer:
-    """Multi-threaded chat server with conversation history"""
+    """Reactor + worker pool chat server with conversation history"""
     
     def __init__(self, host=config.SERVER_HOST, port=config.SERVER_PORT):
         """Initialize server"""
@@ -23,317 +88,635 @@ class ClassChatServer:
         self.port = port
         self.server_socket = None
         self.clients = {}
-        self.client_threads = {}
-        self.groups = {}
-        self.lock = threading.Lock()
+        # Per-user entries (clients/_connections, name reservations) are guarded
+        # by one of LOCK_SHARDS reentrant locks picked by username hash. Writes
+        # to a socket only take that connection's own send lock, never a shard
+        # lock, so a slow client holds up no one but itself. A thread holds at
+        # most one shard lock at a time (no lock ordering, no deadlock).
+        self._locks = [threading.RLock() for _ in range(config.LOCK_SHARDS)]
+        self._lock_mask = config.LOCK_SHARDS - 1
+        self._groups_lock = threading.Lock()  # self.groups, _groups_json
+        self._groups_json = None  # Serialized LIST_GROUPS data, rebuilt after a group is created
+        self._groups_generation = 0  # Bumped on create: a listing read before it is not cached
+        self._users_lock = threading.Lock()  # _users_json, _users_generation
+        self._users_json = None  # Serialized LIST_USERS data, rebuilt after a connect/disconnect
+        self._users_generation = 0  # Bumped after self.clients changes, like _groups_generation
+        self._connecting = set()  # usernames reserved by an in-progress handshake
         self.database = MessageDatabase()
+        self.db_writer = MessageWriter(self.database)  # batched history/offline INSERTs
+        # Registered users, mirrored in memory: existence checks need no query and
+        # registrations can go through the writer queue
+        self.known_users = self.database.get_usernames()
+        # Group memberships, loaded once: authoritative from here on (joins and new
+        # groups update it before their rows are written), so no per-message query
+        self.groups = self.database.get_group_memberships()
         self.running = False
         
         # ENCRYPTION SUPPORT
         self.server_encryption = MessageEncryption()
-        self.client_encryptors = {}  # Store encryption handler for each client
+        # username -> (client_socket, send lock, encryptor or None); replaced
+        # as a whole so one dict lookup gives a consistent snapshot
+        self._connections = {}
+        self.file_transfers = {}  # sender -> [recipients, chunks remaining]
         
-        # Generate RSA key pair for the server
+        # REACTOR - one multiplexer for every client socket, ready ones go to the pool.
+        # A socket is disabled while a worker owns it (epoll one-shot, or unregistered
+        # for poll/select), so each client's frames are handled in order by one worker.
+        self.io_multiplexer = IOMultiplexer(config.IO_METHOD, oneshot=True)
+        self._fd_to_client = {}  # fd -> (client_socket, username, FrameReader, encryptor or None)
+        self._handshakes = {}  # fd -> [reserved username or None, deadline] while connecting
+        self._rearm = collections.deque()  # sockets handed back by workers
+        self._wake_r, self._wake_w = socket.socketpair()  # wakes the reactor to re-register them
+        # A full wake socket already guarantees a wakeup: never block a worker on it
+        self._wake_w.setblocking(False)
+        self._workers = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.SERVER_WORKERS, thread_name_prefix="classchat-worker"
+        )
+        
+        # MESSAGE DISPATCH - msg_type -> handler
+        self._dispatch = self._create_dispatch_table()
+        
+        # Generate the server's static X25519 key pair
         if config.USE_ENCRYPTION:
-            print("[SERVER] Generating RSA key pair...")
-            self.server_encryption.generate_rsa_keys()
-            print("[SERVER] RSA keys generated successfully")
+            print("[SERVER] Generating X25519 key pair...")
+            self.server_encryption.generate_x25519_keys()
+            print("[SERVER] X25519 keys generated successfully")
             print("[SERVER] 🔒 Encryption ENABLED")
+        
+        # The welcome message carries the X25519 public key, so the whole key
+        # exchange costs the client a single round-trip; serialized once here
+        self._welcome_data = b'null'
+        if config.USE_ENCRYPTION:
+            self._welcome_data = Message.serialize(
+                {"public_key": self.server_encryption.get_x25519_public_key()}
+            )
     
     def start(self):
         """Start the server"""
+        _start_queued_logging()
         try:
             self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            configure_socket(self.server_socket)
             self.server_socket.bind((self.host, self.port))
             self.server_socket.listen(5)
             self.running = True
             
             print(f"[SERVER] ClassChat Server started on {self.host}:{self.port}")
             print(f"[SERVER] Waiting for connections...")
+            self._notify_ready()
+            
+            reactor = threading.Thread(target=self._reactor_loop, daemon=True)
+            reactor.start()
             
             while self.running:
                 try:
                     client_socket, address = self.server_socket.accept()
-                    print(f"[SERVER] New connection from {address}")
+                    if not ACCEPT_INHERITS_OPTIONS:
+                        configure_socket(client_socket)  # TCP_NODELAY is not inherited everywhere
+                    log.info("[SERVER] New connection from %s", address)
                     
-                    thread = threading.Thread(
-                        target=self.handle_client,
-                        args=(client_socket,)
-                    )
-                    thread.daemon = True
-                    thread.start()
+                    self._begin_handshake(client_socket)
                     
                 except Exception as e:
                     if self.running:
-                        print(f"[SERVER ERROR] Accept error: {e}")
+                        log.error("[SERVER ERROR] Accept error: %s", e)
                     
         except Exception as e:
             print(f"[SERVER ERROR] Failed to start server: {e}")
             traceback.print_exc()
     
-    def handle_client(self, client_socket):
-        """Handle individual client connection"""
-        username = None
+    @staticmethod
+    def _notify_ready():
+        """
+        Tell the launcher that started this server (if any) that the chat
+        port is open: connect once to the port it passed in READY_PORT_ENV
+        """
+        port = os.environ.get(config.READY_PORT_ENV)
+        if not port:
+            return
         try:
-            username = self.handle_connect(client_socket)
-            
-            if username:
-                while self.running:
+            socket.create_connection(('127.0.0.1', int(port)), timeout=1.0).close()
+        except (OSError, ValueError) as e:
+            log.error("[SERVER ERROR] Could not signal readiness to the launcher: %s", e)
+    
+    def _begin_handshake(self, client_socket):
+        """
+        Hand a new connection to the reactor right away. Its CONNECT and key
+        exchange frames are handled as they arrive, like any other frame, so
+        a slow client never holds a worker while it is connecting.
+        """
+        fd = client_socket.fileno()
+        # One buffered reader per connection: each recv() may carry several
+        # frames, and all of them are handled before the next recv()
+        # Small while idle: memory per connection stays ~16 KiB, not BUFFER_SIZE
+        reader = FrameReader(client_socket, config.SERVER_READ_BUFFER)
+        # Sends often happen inside a fan-out loop: a client that stops (or
+        # trickles) reading may hold that loop up for SEND_TIMEOUT per frame
+        # at most (the per-call socket timeout plus the deadline every send
+        # below passes to send_buffers)
+        set_send_timeout(client_socket, config.SEND_TIMEOUT)
+        self._handshakes[fd] = [None, time.monotonic() + config.HANDSHAKE_TIMEOUT]
+        self._fd_to_client[fd] = (client_socket, None, reader, None)
+        self._arm(client_socket, first=True)
+    
+    def _reactor_loop(self):
+        """Wait on every client socket at once and pass ready ones to the worker pool"""
+        multiplexer = self.io_multiplexer
+        wake_fd = self._wake_r.fileno()
+        multiplexer.register(self._wake_r)
+        next_sweep = time.monotonic() + 1.0
+        
+        while self.running:
+            if self._handshakes and time.monotonic() >= next_sweep:
+                self._expire_handshakes()
+                next_sweep = time.monotonic() + 1.0
+            for fd in multiplexer.poll(timeout=1.0):
+                if fd == wake_fd:
+                    self._register_rearmed()
+                    continue
+                client = self._fd_to_client.get(fd)
+                if client is None:
+                    continue
+                # Not watched again until the worker is done with it
+                if not multiplexer.oneshot:
+                    multiplexer.unregister(client[0])
+                try:
+                    self._workers.submit(self._process_ready, fd)
+                except RuntimeError:
+                    return  # Pool shut down: the server is stopping
+    
+    def _expire_handshakes(self):
+        """
+        Reactor thread: shut down connections still connecting after
+        HANDSHAKE_TIMEOUT. The socket then reads as closed, and whichever
+        worker handles it next closes it the usual way.
+        """
+        now = time.monotonic()
+        for fd, handshake in list(self._handshakes.items()):
+            if handshake[1] <= now and self._handshakes.get(fd) is handshake:
+                client = self._fd_to_client.get(fd)
+                if client is not None:
                     try:
-                        data = client_socket.recv(config.BUFFER_SIZE)
-                        if not data:
-                            break
-                        
-                        message_str = data.decode('utf-8')
-                        
-                        # DECRYPT MESSAGE if encryption is enabled
-                        if config.USE_ENCRYPTION and username in self.client_encryptors:
-                            try:
-                                # Decrypt the message using client's session key
-                                message_str = self.client_encryptors[username].decrypt_message(message_str)
-                            except Exception as e:
-                                print(f"[SERVER ERROR] Decryption error for '{username}': {e}")
-                                continue
-                        
-                        message = Message.parse_message(message_str)
-                        
-                        if message:
-                            msg_type = message.get('type')
-                            
-                            if msg_type == config.MSG_PRIVATE:
-                                self.handle_private_message(message)
-                            elif msg_type == config.MSG_GROUP:
-                                self.handle_group_message(message)
-                            elif msg_type == config.MSG_FILE:
-                                self.handle_file_transfer(message)
-                            elif msg_type == config.MSG_CREATE_GROUP:
-                                self.handle_create_group(message)
-                            elif msg_type == config.MSG_JOIN_GROUP:
-                                self.handle_join_group(message)
-                            elif msg_type == config.MSG_LIST_USERS:
-                                self.handle_list_users(username)
-                            elif msg_type == config.MSG_LIST_GROUPS:
-                                self.handle_list_groups(username)
-                            elif msg_type == config.MSG_HISTORY_REQUEST:
-                                self.handle_history_request(message)
-                            elif msg_type == config.MSG_DISCONNECT:
-                                break
-                                
-                    except Exception as e:
-                        print(f"[SERVER ERROR] Error handling message from {username}: {e}")
-                        break
-                        
+                        client[0].shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+    
+    def _register_rearmed(self):
+        """Reactor thread: register the sockets workers handed back"""
+        try:
+            self._wake_r.recv(4096)
+        except OSError:
+            pass
+        while self._rearm:
+            client_socket = self._rearm.popleft()
+            if client_socket.fileno() in self._fd_to_client:
+                self.io_multiplexer.register(client_socket)
+    
+    def _arm(self, client_socket, first=False):
+        """Worker: return a socket to the reactor"""
+        multiplexer = self.io_multiplexer
+        if multiplexer.oneshot:
+            # epoll may be changed from any thread
+            if first:
+                multiplexer.register(client_socket)
+            else:
+                multiplexer.rearm(client_socket)
+            return
+        # poll/select registrations may only change on the reactor thread
+        self._rearm.append(client_socket)
+        try:
+            self._wake_w.send(b'x')
+        except OSError:
+            pass  # Buffer full (a wakeup is pending anyway) or shutting down
+    
+    def _process_ready(self, fd):
+        """Worker: read whatever a ready client sent and handle every complete frame"""
+        client_socket, username, reader, encryptor = self._fd_to_client[fd]
+        try:
+            if username is None:
+                connected = self._drain_handshake(fd, reader)
+            else:
+                connected = self._drain(username, reader, encryptor)
         except Exception as e:
-            print(f"[SERVER ERROR] Client handler error: {e}")
-            traceback.print_exc()
-        finally:
-            if username:
-                self.handle_disconnect(username)
+            log.error("[SERVER ERROR] Error handling message from %s: %s", username, e)
+            connected = False
+        
+        if connected and self.running:
+            self._arm(client_socket)
+        else:
+            self._close_client(fd)
+    
+    def _drain(self, username, reader, encryptor):
+        """
+        Read and handle everything a ready client has sent so far. Reads use
+        MSG_DONTWAIT until the socket is empty, so one notification covers a
+        whole burst (required by edge-triggered epoll); the socket itself stays
+        blocking for the sendmsg() writes (send_buffers) other workers make on
+        it under the connection's send lock.
+        Without MSG_DONTWAIT (Windows) a single recv is made.
+        
+        Returns:
+            False if the client disconnected, True otherwise
+        """
+        while True:
             try:
-                client_socket.close()
-            except:
-                pass
+                if not reader.fill(MSG_DONTWAIT):
+                    return False
+            except BlockingIOError:
+                return True
+            if not self._handle_frames(username, reader, encryptor):
+                return False
+            if not MSG_DONTWAIT:
+                return True
+    
+    def _drain_handshake(self, fd, reader):
+        """
+        Read what a connecting client sent so far and advance its handshake.
+        Never waits for more data (see _drain).
+        
+        Returns:
+            False if the handshake failed or the client disconnected, True otherwise
+        """
+        while True:
+            try:
+                if not reader.fill(MSG_DONTWAIT):
+                    return False
+            except BlockingIOError:
+                return True
+            frame = reader.next_frame()
+            while frame is not None:
+                if not self.handle_connect(fd, frame):
+                    return False
+                client_socket, username, reader, encryptor = self._fd_to_client[fd]
+                if username is not None:
+                    # Connected: frames sent right behind the handshake are regular
+                    # frames; anything still unread re-triggers the socket once rearmed
+                    return self._handle_frames(username, reader, encryptor)
+                frame = reader.next_frame()
+            if not MSG_DONTWAIT:
+                return True
+    
+    def _handle_frames(self, username, reader, encryptor):
+        """
+        Handle every complete frame buffered in reader
+        
+        Returns:
+            False if the client asked to disconnect, True otherwise
+        """
+        handle_frame = self.handle_frame
+        # Encrypted frames are only read by decrypt_bytes(), which produces a new
+        # buffer: decrypt them straight out of the receive buffer, no copy
+        for frame in reader.frames(views=encryptor is not None):
+            if not handle_frame(username, frame, encryptor):
+                return False
+        return True
     
-    def handle_connect(self, client_socket):
-        """Handle client connection with encryption key exchange: Very Important Part"""
+    def _close_client(self, fd):
+        """Forget a client socket, announce the disconnect and close it"""
+        client = self._fd_to_client.pop(fd, None)
+        if client is None:
+            return
+        client_socket, username = client[0], client[1]
+        if self.io_multiplexer.oneshot:
+            self.io_multiplexer.unregister(client_socket)
+        if username is not None:
+            self.handle_disconnect(username)
+        else:
+            # The handshake never finished: release the name it reserved, if any
+            handshake = self._handshakes.pop(fd, None)
+            if handshake is not None and handshake[0] is not None:
+                with self._lock_for(handshake[0]):
+                    self._connecting.discard(handshake[0])
         try:
-            data = client_socket.recv(config.BUFFER_SIZE)
-            if not data:
-                return None
+            client_socket.close()
+        except:
+            pass
+    
+    def handle_frame(self, username, frame, encryptor=None):
+        """
+        Decrypt, parse and dispatch one frame from a client
+        
+        Args:
+            username: Sender of the frame
+            frame: Frame body as received
+            encryptor: The client's MessageEncryption (None if not encrypted)
+        
+        Returns:
+            False if the client asked to disconnect, True otherwise
+        """
+        # DECRYPT FRAME if encryption is enabled
+        if encryptor is not None:
+            try:
+                # Decrypt the whole body using client's session key
+                frame = encryptor.decrypt_bytes(frame)
+            except Exception as e:
+                log.error("[SERVER ERROR] Decryption error for '%s': %s", username, e)
+                return True
+        
+        message_str, payload = split_frame(frame)
+        
+        message = Message.parse_message(message_str)
+        
+        if message:
+            msg_type = message.get('type')
+            if msg_type == config.MSG_DISCONNECT:
+                return False
             
-            message_str = data.decode('utf-8')
-            message = Message.parse_message(message_str)
+            handler = self._dispatch.get(msg_type)
+            if handler:
+                handler(username, message, payload)
+        
+        return True
+    
+    def _create_dispatch_table(self):
+        """
+        Map message types to their handlers (built once, O(1) lookup per message).
+        Every entry is called as handler(username, message, payload).
+        """
+        return {
+            config.MSG_PRIVATE: lambda username, message, payload: self.handle_private_message(message),
+            config.MSG_GROUP: lambda username, message, payload: self.handle_group_message(message),
+            config.MSG_FILE: lambda username, message, payload: self.handle_file_transfer(message),
+            config.MSG_FILE_CHUNK: lambda username, message, payload: self.handle_file_chunk(message, payload),
+            config.MSG_CREATE_GROUP: lambda username, message, payload: self.handle_create_group(message),
+            config.MSG_JOIN_GROUP: lambda username, message, payload: self.handle_join_group(message),
+            config.MSG_LIST_USERS: lambda username, message, payload: self.handle_list_users(username),
+            config.MSG_LIST_GROUPS: lambda username, message, payload: self.handle_list_groups(username),
+            config.MSG_HISTORY_REQUEST: lambda username, message, payload: self.handle_history_request(message)
+        }
+    
+    def _lock_for(self, username):
+        """Shard lock guarding username's entries (sends use the connection's own lock)"""
+        return self._locks[hash(username) & self._lock_mask]
+    
+    def handle_connect(self, fd, frame):
+        """
+        Handle one handshake frame: CONNECT, then the client's KEY_EXCHANGE
+        when encryption is enabled. Very Important Part
+        
+        Args:
+            fd: File descriptor of the connecting socket
+            frame: Frame body as received
+        
+        Returns:
+            False if the connection must be closed, True otherwise
+        """
+        client_socket = self._fd_to_client[fd][0]
+        handshake = self._handshakes[fd]
+        username = handshake[0]
+        try:
+            message = Message.parse_message(frame)
             
-            if message and message.get('type') == config.MSG_CONNECT:
+            if username is None:
+                if not (message and message.get('type') == config.MSG_CONNECT):
+                    return False
                 username = message.get('sender')
+                # Checked before it is hashed for a lock or reserved
+                if not (isinstance(username, str) and username):
+                    log.error("[SERVER ERROR] CONNECT without a valid username: %r", username)
+                    return False
                 
-                with self.lock:
-                    if username in self.clients:
-                        error_msg = Message.create_error_message(
-                            f"Username '{username}' is already taken"
-                        )
-                        client_socket.send(error_msg.encode())
-                        return None
-                    
-                    self.clients[username] = client_socket
-                    print(f"[SERVER] '{username}' connected")
-                    
-                    # REGISTER USER IN DATABASE
-                    self.database.register_user(username)
-                    print(f"[SERVER] User '{username}' registered in database")
-                    
-                    success_msg = Message.create_success_message(
-                        f"Welcome to ClassChat, {username}!"
-                    )
-                    client_socket.send(success_msg.encode())
-                    
-                    # ENCRYPTION KEY EXCHANGE
-                    if config.USE_ENCRYPTION:
-                        print(f"[SERVER] Starting key exchange with '{username}'")
-                        
-                        # Send RSA public key to client
-                        public_key_pem = self.server_encryption.get_public_key_pem()
-                        key_exchange_msg = Message.create_message(
-                            config.MSG_KEY_EXCHANGE,
-                            "SERVER",
-                            username,
-                            None,
-                            {"public_key": public_key_pem, "step": "server_public_key"}
-                        )
-                        client_socket.send(key_exchange_msg.encode())
-                        print(f"[SERVER] Sent RSA public key to '{username}'")
-                        
-                        # Wait for encrypted session key from client
-                        key_data = client_socket.recv(config.BUFFER_SIZE)
-                        if not key_data:
-                            print(f"[SERVER ERROR] Failed to receive session key from '{username}'")
-                            return None
-                        
-                        key_message_str = key_data.decode('utf-8')
-                        key_message = Message.parse_message(key_message_str)
-                        
-                        if key_message and key_message.get('type') == config.MSG_KEY_EXCHANGE:
-                            encrypted_session_key = key_message.get('data', {}).get('encrypted_session_key')
-                            
-                            if encrypted_session_key:
-                                # Create encryption handler for this client
-                                client_encryptor = MessageEncryption()
-                                client_encryptor.rsa_private_key = self.server_encryption.rsa_private_key
-                                
-                                # Decrypt session key
-                                client_encryptor.decrypt_session_key(encrypted_session_key)
-                                
-                                # Store encryption handler for this client
-                                self.client_encryptors[username] = client_encryptor
-                                print(f"[SERVER] ✅ Session key established with '{username}'")
-                                
-                                # Send ACK
-                                ack_msg = Message.create_message(
-                                    config.MSG_KEY_EXCHANGE,
-                                    "SERVER",
-                                    username,
-                                    None,
-                                    {"step": "complete"}
-                                )
-                                client_socket.send(ack_msg.encode())
-                            else:
-                                print(f"[SERVER ERROR] No encrypted session key received from '{username}'")
-                                return None
-                        else:
-                            print(f"[SERVER ERROR] Invalid key exchange message from '{username}'")
-                            return None
-                    
-                    time.sleep(0.5)
-                    
-                    print(f"[SERVER DEBUG] Checking offline messages for '{username}'")
-                    self.send_offline_messages(username)
-                    
-                    return username
-                    
-                    time.sleep(0.5)
+                # Reserve the name; it is released by _close_client if the handshake fails
+                with self._lock_for(username):
+                    if username in self.clients or username in self._connecting:
+                        send_frame(client_socket, Message.create_username_taken_message(username))
+                        return False
+                    self._connecting.add(username)
+                handshake[0] = username
+                
+                # REGISTER USER IN DATABASE
+                self.known_users.add(username)
+                self.db_writer.register_user(username)
+                log.info("[SERVER] User '%s' registered in database", username)
+                
+                send_frame(client_socket, Message.create_welcome_message(username, self._welcome_data))
+                
+                if config.USE_ENCRYPTION:
+                    log.info("[SERVER] Sent X25519 public key to '%s'", username)
+                else:
+                    self._finish_connect(fd, username, None)
+                return True
+            
+            # ENCRYPTION KEY EXCHANGE - the client's ephemeral public key
+            if message and message.get('type') == config.MSG_KEY_EXCHANGE:
+                client_public_key = (message.get('data') or {}).get('public_key')
+                
+                if client_public_key:
+                    # Create encryption handler for this client
+                    client_encryptor = MessageEncryption()
+                    client_encryptor.x25519_private_key = self.server_encryption.x25519_private_key
                     
-                    print(f"[SERVER DEBUG] Checking offline messages for '{username}'")
-                    self.send_offline_messages(username)
+                    # Derive session key (ECDH + HKDF); the client derived the same
+                    # key before sending, so no acknowledgement round-trip is needed
+                    client_encryptor.derive_session_key(client_public_key)
                     
-                    return username
+                    log.info("[SERVER] ✅ Session key established with '%s'", username)
+                    self._finish_connect(fd, username, client_encryptor)
+                    return True
+                log.error("[SERVER ERROR] No public key received from '%s'", username)
+            else:
+                log.error("[SERVER ERROR] Invalid key exchange message from '%s'", username)
+            return False
                     
         except Exception as e:
-            print(f"[SERVER ERROR] Connection handling error: {e}")
-            return None
+            log.error("[SERVER ERROR] Connection handling error: %s", e)
+            return False
+    
+    def _finish_connect(self, fd, username, client_encryptor):
+        """Publish a client whose handshake is complete and deliver what it missed"""
+        client_socket, _, reader, _ = self._fd_to_client[fd]
+        
+        # Visible to other threads only once the session key is known,
+        # so nothing is ever sent to this client unencrypted
+        with self._lock_for(username):
+            self._connections[username] = (client_socket, threading.Lock(), client_encryptor)
+            self.clients[username] = client_socket
+            self._connecting.discard(username)
+        generation = self._invalidate_user_list()
+        del self._handshakes[fd]
+        # The session key is fixed for the connection: frames are decrypted with it from now on
+        self._fd_to_client[fd] = (client_socket, username, reader, client_encryptor)
+        log.info("[SERVER] '%s' connected", username)
+        
+        # Tell everyone else (their lists update without polling)
+        self.broadcast_user_delta(username, 'online', generation)
+        
+        log.debug("[SERVER DEBUG] Checking offline messages for '%s'", username)
+        self.send_offline_messages(username)
     
     def handle_disconnect(self, username):
         """Handle client dis-connection"""
-        with self.lock:
-            if username in self.clients:
-                del self.clients[username]
-                print(f"[SERVER] '{username}' disconnected")
+        with self._lock_for(username):
+            was_online = self.clients.pop(username, None) is not None
+            connection = self._connections.pop(username, None)
+            had_encryptor = connection is not None and connection[2] is not None
 
-            # Clean up encryption handler
-            if username in self.client_encryptors:
-                del self.client_encryptors[username]
-                print(f"[SERVER] Encryption handler removed for '{username}'")
+        if was_online:
+            generation = self._invalidate_user_list()
+            log.info("[SERVER] '%s' disconnected", username)
+            self.broadcast_user_delta(username, 'offline', generation)
+        if had_encryptor:
+            log.info("[SERVER] Encryption handler removed for '%s'", username)
 
+        # Drop any unfinished file transfer from this client
+        self.file_transfers.pop(username, None)
+
+    
+    def broadcast(self, message_str, exclude=None):
+        """
+        Send one message to every connected client (except `exclude`)
+        Call without holding a shard lock; clients only appear in
+        self.clients once their key exchange is complete.
+        """
+        for username in list(self.clients):
+            if username != exclude:
+                self.send_encrypted_message(username, message_str)
+    
+    def broadcast_user_delta(self, username, status, generation):
+        """
+        Push a single user status change instead of making clients re-list
+        (generation: the user-list generation this change produced, so a
+        client can tell a LIST_USERS snapshot taken before it)
+        """
+        self.broadcast(Message.create_message(
+            config.MSG_USER_DELTA, "SERVER", None, None,
+            {'username': username, 'status': status, 'generation': generation}
+        ), exclude=username)
     
-    def send_encrypted_message(self, username, message_str):
+    def send_encrypted_message(self, username, message_str, payload=None):
         """
         Send encrypted message to a client
+        (message_str: JSON/packed message bytes from Message.create_*,
+         payload: optional raw binary file contents sent in the same frame)
         """
-        if username not in self.clients:
+        connection = self._connections.get(username)
+        if connection is None:
             return False
+        return self._send_raw(username, connection, message_str, payload)
+    
+    def _send_raw(self, username, connection, message_str, payload=None):
+        """
+        Send one frame on a connection snapshot taken from self._connections
+        (no shard lock needed: its send lock keeps each frame whole)
         
+        Returns:
+            True if sent, False if the send failed
+        """
+        client_socket, send_lock, encryptor = connection
         try:
-            client_socket = self.clients[username]
-            
-            # Encrypt message if encryption is enabled
-            if config.USE_ENCRYPTION and username in self.client_encryptors:
-                encrypted_msg = self.client_encryptors[username].encrypt_message(message_str)
-                client_socket.send(encrypted_msg.encode())
-            else:
-                client_socket.send(message_str.encode())
+            with send_lock:
+                # Encrypt the whole frame body if encryption is enabled
+                if encryptor is not None:
+                    send_sealed_frame(client_socket, *encryptor.seal(frame_body(message_str, payload)),
+                                      timeout=config.SEND_TIMEOUT)
+                else:
+                    send_frame(client_socket, message_str, payload, timeout=config.SEND_TIMEOUT)
             
             return True
         except Exception as e:
-            print(f"[SERVER ERROR] Failed to send message to '{username}': {e}")
+            log.error("[SERVER ERROR] Failed to send message to '%s': %s", username, e)
+            self._drop(client_socket)
             return False
     
+    def send_encrypted_messages(self, username, messages):
+        """
+        Send several messages to a client in one gathered write (e.g. the
+        offline backlog) instead of one send per message
+        
+        Returns:
+            True if sent, False if the client is offline or the send failed
+        """
+        connection = self._connections.get(username)
+        if connection is None:
+            return False
+        
+        client_socket, send_lock, encryptor = connection
+        try:
+            with send_lock:
+                if encryptor is not None:
+                    send_sealed_frames(client_socket, map(encryptor.seal, messages), timeout=config.SEND_TIMEOUT)
+                else:
+                    send_frames(client_socket, messages, timeout=config.SEND_TIMEOUT)
+            return True
+        except Exception as e:
+            log.error("[SERVER ERROR] Failed to send messages to '%s': %s", username, e)
+            self._drop(client_socket)
+            return False
+    
+    def _deliver_or_store(self, username, message_str, store):
+        """
+        Send a message if username is online, otherwise call store() to keep
+        it for later. Only the online check and store() run under the user's
+        shard lock (a concurrent login either sees the stored row or is
+        already online for the send); the send itself runs outside it.
+        
+        Returns:
+            True if sent, False if stored
+        """
+        with self._lock_for(username):
+            connection = self._connections.get(username)
+            if connection is None:
+                store()
+                return False
+        
+        if self._send_raw(username, connection, message_str):
+            return True
+        # The connection failed mid-send and is being dropped: keep the message
+        with self._lock_for(username):
+            store()
+        return False
+    
+    @staticmethod
+    def _drop(client_socket):
+        """
+        Disconnect a client after a failed or timed-out send: part of a frame
+        may have been written, so the stream cannot be used any more. The
+        socket then reads as closed and its worker closes it the usual way.
+        """
+        try:
+            client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    
     def handle_private_message(self, message):
         """Handle private message with history storage"""
         sender = message.get('sender')
         receiver = message.get('receiver')
         text = message.get('text')
         
-        print(f"[SERVER] Private message from '{sender}' to '{receiver}': {text}")
-        
-        with self.lock:
-            # CHECK IF RECEIVER EXISTS
-            if not self.database.user_exists(receiver):
-                print(f"[SERVER] User '{receiver}' does not exist")
-                if sender in self.clients:
-                    error_msg = Message.create_error_message(
-                        f"❌ User '{receiver}' does not exist. Cannot send message."
-                    )
-                    self.send_encrypted_message(sender, error_msg)
-                return
-            
-            # STORE MESSAGE IN HISTORY (for conversation threading)
-            self.database.store_message(
-                sender=sender,
-                receiver=receiver,
-                message_text=text,
-                message_type=config.MSG_PRIVATE
-            )
-            
-            if receiver in self.clients:
-                try:
-                    # Send message to receiver (encrypted)
-                    self.send_encrypted_message(receiver, json.dumps(message))
-                    
-                    # Send confirmation to sender (encrypted)
-                    if sender in self.clients:
-                        confirm_msg = Message.create_success_message(
-                            f"Message delivered to {receiver}"
-                        )
-                        self.send_encrypted_message(sender, confirm_msg)
-                
-                except Exception as e:
-                    print(f"[SERVER ERROR] Failed to deliver message: {e}")
-            
-            else:
-                print(f"[SERVER] '{receiver}' is offline. Storing message.")
-                self.database.store_offline_message(
-                    receiver, sender, config.MSG_PRIVATE, json.dumps(message)
-                )
-                
-                sender_socket = self.clients.get(sender)
-                if sender_socket:
-                    offline_msg = Message.create_message(
-                        config.MSG_OFFLINE,
-                        "SERVER",
-                        sender,
-                        f"📬 '{receiver}' is offline. Message will be delivered when they connect."
-                    )
-                    sender_socket.send(offline_msg.encode())
+        log.info("[SERVER] Private message from '%s' to '%s': %s", sender, receiver, text)
+        
+        # CHECK IF RECEIVER EXISTS
+        if receiver not in self.known_users:
+            log.info("[SERVER] User '%s' does not exist", receiver)
+            if sender in self.clients:
+                self.send_encrypted_message(sender, unknown_user_error(receiver))
+            return
+        
+        # STORE MESSAGE IN HISTORY (for conversation threading)
+        self.db_writer.store_message(
+            sender=sender,
+            receiver=receiver,
+            message_text=text,
+            message_type=config.MSG_PRIVATE
+        )
+        
+        # Encoded once: the same bytes are sent now or stored for later delivery
+        packed_message = Message.pack_private(sender, receiver, text)
+        
+        delivered = self._deliver_or_store(
+            receiver, packed_message,
+            lambda: self.db_writer.store_offline_message(receiver, sender, config.MSG_PRIVATE, packed_message)
+        )
+        if not delivered:
+            log.info("[SERVER] '%s' is offline. Storing message.", receiver)
+        
+        # Confirmation to the sender (encrypted), outside the receiver's lock
+        if delivered:
+            self.send_encrypted_message(sender, delivery_receipt(receiver))
+        elif sender in self.clients:
+            self.send_encrypted_message(sender, offline_notice(sender, receiver))
     
     def handle_group_message(self, message):
         """Handle group message with offline support and history"""
@@ -341,53 +724,51 @@ class ClassChatServer:
         group_name = message.get('receiver')
         text = message.get('text')
         
-        print(f"[SERVER] Group message from '{sender}' to '{group_name}': {text}")
+        log.info("[SERVER] Group message from '%s' to '%s': %s", sender, group_name, text)
         
-        with self.lock:
-            if group_name not in self.groups:
-                print(f"[SERVER] Group '{group_name}' not found")
+        with self._groups_lock:
+            members = self.groups.get(group_name)
+            if members is None:
+                log.info("[SERVER] Group '%s' not found", group_name)
                 return
+            members = set(members)
+        
+        # STORE IN HISTORY
+        self.db_writer.store_message(
+            sender=sender,
+            receiver=group_name,
+            message_text=text,
+            message_type=config.MSG_GROUP,
+            is_group=True,
+            group_name=group_name
+        )
+        
+        delivered_count = 0
+        offline_count = 0
+        # Encoded once: the same bytes are sent to online members and stored for offline ones
+        packed_message = Message.pack_group(sender, group_name, text)
+        
+        store_offline_message = self.db_writer.store_offline_message
+        deliver_or_store = self._deliver_or_store
+        for member in members:
+            if member == sender or member not in self.known_users:
+                continue
             
-            # STORE IN HISTORY
-            self.database.store_message(
+            # Deliver, or store if offline; a slow member only delays this loop
+            store = lambda member=member: store_offline_message(
+                receiver=member,
                 sender=sender,
-                receiver=group_name,
-                message_text=text,
                 message_type=config.MSG_GROUP,
+                content=packed_message,
                 is_group=True,
                 group_name=group_name
             )
-            
-            members = self.groups.get(group_name, set())
-            db_members = self.database.get_group_members(group_name)
-            members = members.union(set(db_members))
-            
-            delivered_count = 0
-            offline_count = 0
-            
-            for member in members:
-                if member == sender:
-                    continue
-                
-                if member in self.clients:
-                    try:
-                        self.send_encrypted_message(member, json.dumps(message))
-                        delivered_count += 1
-                    except Exception as e:
-                        print(f"[SERVER ERROR] Failed to deliver to '{member}': {e}")
-                else:
-                    if self.database.user_exists(member):
-                        self.database.store_offline_message(
-                            receiver=member,
-                            sender=sender,
-                            message_type=config.MSG_GROUP,
-                            content=json.dumps(message),
-                            is_group=True,
-                            group_name=group_name
-                        )
-                        offline_count += 1
-            
-            print(f"[SERVER] Group message: {delivered_count} online, {offline_count} offline")
+            if deliver_or_store(member, packed_message, store):
+                delivered_count += 1
+            else:
+                offline_count += 1
+        
+        log.info("[SERVER] Group message: %s online, %s offline", delivered_count, offline_count)
     
     def handle_history_request(self, message):
         """Handle conversation history request"""
@@ -395,87 +776,127 @@ class ClassChatServer:
         other_user = message['data'].get('other_user')
         is_group = message['data'].get('is_group', False)
         
-        print(f"[SERVER] History request from '{requester}' for '{other_user}'")
+        log.info("[SERVER] History request from '%s' for '%s'", requester, other_user)
         
-        with self.lock:
-            if is_group:
-                history = self.database.get_group_history(other_user, limit=config.HISTORY_MESSAGE_LIMIT)
-            else:
-                history = self.database.get_conversation_history(requester, other_user, 
-                                                                limit=config.HISTORY_MESSAGE_LIMIT)
-            
-            if requester in self.clients:
-                response = Message.create_message(
-                    config.MSG_HISTORY_RESPONSE,
-                    "SERVER",
-                    requester,
-                    None,
-                    {
-                        'other_user': other_user,
-                        'is_group': is_group,
-                        'messages': history
-                    }
-                )
-                self.send_encrypted_message(requester, response)
-                print(f"[SERVER] Sent {len(history)} messages to '{requester}'")
+        # Queued rows must be committed before they can be read back
+        self.db_writer.flush()
+        
+        if is_group:
+            history = self.database.get_group_history(other_user, limit=config.HISTORY_MESSAGE_LIMIT)
+        else:
+            history = self.database.get_conversation_history(requester, other_user, 
+                                                            limit=config.HISTORY_MESSAGE_LIMIT)
+        
+        if requester in self.clients:
+            response = Message.create_message(
+                config.MSG_HISTORY_RESPONSE,
+                "SERVER",
+                requester,
+                None,
+                {
+                    'other_user': other_user,
+                    'is_group': is_group,
+                    'messages': history
+                }
+            )
+            self.send_encrypted_message(requester, response)
+            log.info("[SERVER] Sent %s messages to '%s'", len(history), requester)
     
     def handle_file_transfer(self, message):
-        """Handle file transfer"""
+        """
+        Handle file transfer header.
+        Records the online recipients so the following FILE_CHUNK frames
+        are relayed one by one without buffering the whole file.
+        """
         sender = message.get('sender')
         receiver = message.get('receiver')
         is_group = message.get('is_group', False)
+        chunks = message.get('data', {}).get('chunks', 0)
         
-        with self.lock:
-            if is_group:
-                if receiver in self.groups:
-                    for member in self.groups[receiver]:
-                        if member != sender and member in self.clients:
-                            try:
-                                self.send_encrypted_message(member, json.dumps(message))
-                            except Exception as e:
-                                print(f"[SERVER ERROR] File transfer to {member} failed: {e}")
-            else:
-                if receiver in self.clients:
-                    try:
-                        self.send_encrypted_message(receiver, json.dumps(message))
-                    except Exception as e:
-                        print(f"[SERVER ERROR] File transfer failed: {e}")
+        if is_group:
+            with self._groups_lock:
+                members = list(self.groups.get(receiver, ()))
+            recipients = [m for m in members if m != sender and m in self.clients]
+        else:
+            recipients = [receiver] if receiver in self.clients else []
+        
+        header = Message.serialize(message)
+        for recipient in recipients:
+            try:
+                self.send_encrypted_message(recipient, header)
+            except Exception as e:
+                log.error("[SERVER ERROR] File transfer to %s failed: %s", recipient, e)
+        
+        # Only this sender's worker touches its entry (frames are handled in order)
+        if chunks:
+            self.file_transfers[sender] = [recipients, chunks]
+    
+    def handle_file_chunk(self, message, payload):
+        """Relay one file chunk to the recipients of the sender's current transfer"""
+        sender = message.get('sender')
+        
+        transfer = self.file_transfers.get(sender)
+        if transfer is None or payload is None:
+            return
+        
+        # The received body (chunk header, b'\n', file bytes) is exactly what
+        # every recipient gets: relay it as is (payload is a view into it
+        # from split_frame), with no re-serialization or per-recipient join
+        body = payload.obj
+        for recipient in transfer[0]:
+            try:
+                self.send_encrypted_message(recipient, body)
+            except Exception as e:
+                log.error("[SERVER ERROR] File chunk to %s failed: %s", recipient, e)
+        
+        transfer[1] -= 1
+        if transfer[1] <= 0:
+            self.file_transfers.pop(sender, None)
     
     def handle_create_group(self, message):
         """Handle group creation"""
         username = message.get('sender')
         group_name = message['data']['group_name']
         
-        with self.lock:
-            if self.database.create_group(group_name, username):
-                self.groups[group_name] = {username}
-                print(f"[SERVER] Group '{group_name}' created by '{username}'")
-                
-                if username in self.clients:
-                    success_msg = Message.create_success_message(
-                        f"Group '{group_name}' created successfully"
-                    )
-                    self.send_encrypted_message(username, success_msg)
-            else:
-                if username in self.clients:
-                    error_msg = Message.create_error_message(
-                        f"Group '{group_name}' already exists"
-                    )
-                    self.send_encrypted_message(username, error_msg)
+        if self.database.create_group(group_name, username):
+            with self._groups_lock:
+                # Members who joined before the group was created stay in it
+                self.groups.setdefault(group_name, set()).add(username)
+                self._groups_json = None
+                self._groups_generation += 1
+            log.info("[SERVER] Group '%s' created by '%s'", group_name, username)
+            
+            self.broadcast(Message.create_message(
+                config.MSG_GROUP_DELTA, "SERVER", None, None,
+                {'name': group_name, 'creator': username}
+            ))
+            
+            if username in self.clients:
+                success_msg = Message.create_success_message(
+                    f"Group '{group_name}' created successfully"
+                )
+                self.send_encrypted_message(username, success_msg)
+        else:
+            if username in self.clients:
+                error_msg = Message.create_error_message(
+                    f"Group '{group_name}' already exists"
+                )
+                self.send_encrypted_message(username, error_msg)
     
     def handle_join_group(self, message):
         """Handle user joining group"""
         username = message.get('sender')
         group_name = message['data']['group_name']
         
-        with self.lock:
+        with self._groups_lock:
             if group_name not in self.groups:
                 self.groups[group_name] = set()
             
             self.groups[group_name].add(username)
-            self.database.add_group_member(group_name, username)
+        # self.groups already has the member, so the row can be committed later
+        self.db_writer.add_group_member(group_name, username)
         
-        print(f"[SERVER] '{username}' joined group '{group_name}'")
+        log.info("[SERVER] '%s' joined group '%s'", username, group_name)
         
         if username in self.clients:
             success_msg = Message.create_success_message(
@@ -485,39 +906,68 @@ class ClassChatServer:
     
     def handle_list_users(self, username):
         """Send list of online users"""
-        with self.lock:
-            users = [{'username': user, 'status': 'online'} for user in self.clients.keys()]
+        if username not in self.clients:
+            return
         
-        if username in self.clients:
-            response = Message.create_message(
-                config.MSG_LIST_USERS,
-                "SERVER",
-                username,
-                None,
-                {'users': users}
-            )
-            self.send_encrypted_message(username, response)
+        # Built once per change to the online set, then every request just
+        # wraps the cached bytes (as handle_list_groups does)
+        with self._users_lock:
+            users_json = self._users_json
+            generation = self._users_generation
+        if users_json is None:
+            # Stamped with the generation read before the snapshot: clients
+            # drop it if they already applied a delta from a later change
+            users_json = Message.serialize({
+                'users': [{'username': user, 'status': 'online'} for user in list(self.clients)],
+                'generation': generation
+            })
+            with self._users_lock:
+                if self._users_generation == generation:
+                    self._users_json = users_json
+        
+        self.send_encrypted_message(
+            username, Message.create_server_message(config.MSG_LIST_USERS, username, users_json)
+        )
+    
+    def _invalidate_user_list(self):
+        """
+        Drop the cached LIST_USERS data (call after self.clients changes)
+        
+        Returns:
+            The new user-list generation
+        """
+        with self._users_lock:
+            self._users_json = None
+            self._users_generation += 1
+            return self._users_generation
     
     def handle_list_groups(self, username):
         """Send list of available groups"""
-        groups = self.database.get_all_groups()
+        if username not in self.clients:
+            return
         
-        if username in self.clients:
-            response = Message.create_message(
-                config.MSG_LIST_GROUPS,
-                "SERVER",
-                username,
-                None,
-                {'groups': groups}
-            )
-            self.send_encrypted_message(username, response)
+        # The list only changes when a group is created: query and serialize it
+        # once, then every request just wraps the cached bytes
+        with self._groups_lock:
+            groups_json = self._groups_json
+            generation = self._groups_generation
+        if groups_json is None:
+            groups_json = Message.serialize({'groups': self.database.get_all_groups()})
+            with self._groups_lock:
+                if self._groups_generation == generation:
+                    self._groups_json = groups_json
+        
+        self.send_encrypted_message(
+            username, Message.create_server_message(config.MSG_LIST_GROUPS, username, groups_json)
+        )
     
     def send_offline_messages(self, username):
         """Send stored offline messages"""
+        self.db_writer.flush()
         messages = self.database.get_offline_messages(username)
         
         if messages:
-            print(f"[SERVER] Sending {len(messages)} offline messages to '{username}'")
+            log.info("[SERVER] Sending %s offline messages to '%s'", len(messages), username)
             
             if username in self.clients:
                 notification_msg = Message.create_message(
@@ -526,44 +976,42 @@ class ClassChatServer:
                     username,
                     f"You have {len(messages)} offline message(s)"
                 )
-                try:
-                    self.send_encrypted_message(username, notification_msg)
-                    time.sleep(0.1)
-                except Exception as e:
-                    print(f"[SERVER ERROR] Failed to send notification: {e}")
-                
-                sent_count = 0
-                for i, msg in enumerate(messages):
-                    try:
-                        self.send_encrypted_message(username, msg['content'])
-                        sent_count += 1
-                        
-                        if i < len(messages) - 1:
-                            time.sleep(0.2)
-                        
-                    except Exception as e:
-                        print(f"[SERVER ERROR] Failed to send offline message {i+1}: {e}")
-                        break
+                contents = [notification_msg]
+                for msg in messages:
+                    # Stored exactly as it would have been sent (packed message bytes)
+                    content = msg['content']
+                    # Rows stored before content was kept as bytes come back as str
+                    if isinstance(content, str):
+                        content = content.encode('utf-8')
+                    contents.append(content)
                 
-                if sent_count == len(messages):
-                    self.database.mark_messages_delivered(username)
+                # Frames are length-prefixed, so the whole backlog goes out
+                # back to back in one gathered write
+                if self.send_encrypted_messages(username, contents):
+                    # Mark exactly the rows that went out (by id), so a message
+                    # stored meanwhile is kept for later
+                    self.db_writer.mark_delivered(msg['id'] for msg in messages)
         else:
-            print(f"[SERVER] No offline messages for '{username}'")
+            log.info("[SERVER] No offline messages for '%s'", username)
     
     def shutdown(self):
         """Shutdown server"""
         print("[SERVER] Shutting down...")
         self.running = False
         
-        with self.lock:
-            for client_socket in self.clients.values():
-                try:
-                    client_socket.close()
-                except:
-                    pass
+        for client_socket in list(self.clients.values()):
+            try:
+                client_socket.close()
+            except:
+                pass
         
         if self.server_socket:
             self.server_socket.close()
+        
+        self._workers.shutdown(wait=False)
+        self.db_writer.close()
+        self.database.close()
+        _stop_queued_logging()
 
 
 def main():